@@ -0,0 +1,100 @@
+"""
+Compares /submit latency when Firestore calls block the event loop against
+running them through firebase_util.offload.
+
+Each simulated /submit performs the same sequence of round trips the handler
+chain makes (get_role, has_race_started, recent_location_update,
+get_current_challenge, has_active_bonus_challenge) with a fixed simulated RTT.
+
+    python benchmarks/bench_firestore_offload.py [--rtt-ms 40] [--updates 64]
+"""
+
+import os
+import sys
+import time
+import asyncio
+import argparse
+import statistics
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import firebase_util
+from constants import TELEGRAM_CONCURRENT_UPDATES
+
+# Round trips per /submit: get_role (users + admins), has_race_started,
+# recent_location_update, get_current_challenge (group + query),
+# has_active_bonus_challenge
+SUBMIT_ROUND_TRIPS = 7
+
+
+def make_round_trip(rtt: float):
+    def round_trip():
+        time.sleep(rtt)
+
+    return round_trip
+
+
+async def submit_blocking(round_trip) -> float:
+    start = time.perf_counter()
+    for _ in range(SUBMIT_ROUND_TRIPS):
+        round_trip()
+        await asyncio.sleep(0)
+    return time.perf_counter() - start
+
+
+async def submit_offloaded(round_trip) -> float:
+    start = time.perf_counter()
+    for _ in range(SUBMIT_ROUND_TRIPS):
+        await round_trip()
+    return time.perf_counter() - start
+
+
+async def run(handler, round_trip, updates: int) -> tuple[list[float], float]:
+    # Mirrors Application.concurrent_updates: at most N updates in flight
+    semaphore = asyncio.Semaphore(TELEGRAM_CONCURRENT_UPDATES)
+    queued_at = {}
+
+    async def process(i: int) -> float:
+        async with semaphore:
+            await handler(round_trip)
+            return time.perf_counter() - queued_at[i]
+
+    start = time.perf_counter()
+    tasks = []
+    for i in range(updates):
+        queued_at[i] = time.perf_counter()
+        tasks.append(asyncio.create_task(process(i)))
+    latencies = await asyncio.gather(*tasks)
+    return latencies, time.perf_counter() - start
+
+
+def report(name: str, latencies: list[float], wall: float):
+    latencies = sorted(latencies)
+    p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+    print(
+        f"{name:<10} p50={statistics.median(latencies) * 1000:8.1f}ms "
+        f"p99={p99 * 1000:8.1f}ms max={latencies[-1] * 1000:8.1f}ms "
+        f"wall={wall:6.2f}s throughput={len(latencies) / wall:6.1f} updates/s"
+    )
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rtt-ms", type=float, default=40)
+    parser.add_argument("--updates", type=int, default=64)
+    args = parser.parse_args()
+
+    round_trip = make_round_trip(args.rtt_ms / 1000)
+    print(
+        f"{args.updates} concurrent /submit updates, {SUBMIT_ROUND_TRIPS} round trips "
+        f"each, {args.rtt_ms}ms RTT, {TELEGRAM_CONCURRENT_UPDATES} concurrent updates"
+    )
+    report("before", *await run(submit_blocking, round_trip, args.updates))
+    report(
+        "after",
+        *await run(submit_offloaded, firebase_util.offload(round_trip), args.updates),
+    )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
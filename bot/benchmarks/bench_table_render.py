@@ -0,0 +1,138 @@
+"""
+Compares the Pillow /status table renderer against the previous matplotlib
+implementation. Each renderer runs in its own subprocess so import time and
+peak resident memory are measured independently.
+
+Requires matplotlib, which the bot itself no longer depends on.
+
+    python benchmarks/bench_table_render.py [--groups 14] [--runs 20]
+"""
+
+import os
+import sys
+import json
+import time
+import resource
+import argparse
+import subprocess
+
+BOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BOT_DIR)
+
+
+def matplotlib_renderer():
+    from io import BytesIO
+    import matplotlib
+
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+    from matplotlib.font_manager import FontProperties
+
+    # create_table as it was before the Pillow renderer
+    def create_table(data):
+        fig, ax = plt.subplots(figsize=(10, 10))
+        table = ax.table(
+            cellText=data,
+            colLabels=["Group", "Status"],
+            cellLoc="center",
+            loc="center",
+            bbox=[0, 0, 1, 1],
+        )
+        fig.tight_layout()
+
+        for (row, col), cell in table.get_celld().items():
+            cell.PAD = 0.5
+            if (row == 0) or (col == -1):
+                cell.set_text_props(fontproperties=FontProperties(weight="bold"))
+
+        ax.axis("off")
+        table.auto_set_font_size(False)
+        table.set_fontsize(14)
+        table.auto_set_column_width(col=list(range(2)))
+
+        buffer = BytesIO()
+        plt.savefig(buffer, format="png")
+        buffer.seek(0)
+        plt.close()
+        return buffer
+
+    return create_table
+
+
+def pillow_renderer():
+    from table_renderer import render_table
+
+    return lambda data: render_table(["Group", "Status"], data)
+
+
+RENDERERS = {"matplotlib": matplotlib_renderer, "pillow": pillow_renderer}
+
+
+def measure(name: str, groups: int, runs: int) -> dict:
+    rows = [[f"Group {i}", f"{i % 6} locations finished"] for i in range(groups)]
+
+    start = time.perf_counter()
+    render = RENDERERS[name]()
+    import_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    size = len(render(rows).getvalue())
+    first_render = time.perf_counter() - start
+
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        render(rows)
+        timings.append(time.perf_counter() - start)
+
+    return {
+        "import_ms": import_time * 1000,
+        "first_ms": first_render * 1000,
+        "mean_ms": sum(timings) / len(timings) * 1000,
+        "png_kb": size / 1024,
+        # ru_maxrss is in KiB on Linux
+        "max_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--groups", type=int, default=14)
+    parser.add_argument("--runs", type=int, default=20)
+    parser.add_argument("--child", choices=RENDERERS.keys())
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(measure(args.child, args.groups, args.runs)))
+        return
+
+    results = {}
+    for name in RENDERERS:
+        output = subprocess.run(
+            [sys.executable, __file__, "--child", name]
+            + ["--groups", str(args.groups), "--runs", str(args.runs)],
+            capture_output=True,
+            text=True,
+        )
+        if output.returncode != 0:
+            print(f"{name}: failed\n{output.stderr}")
+            continue
+        results[name] = json.loads(output.stdout)
+        r = results[name]
+        print(
+            f"{name:<11} import={r['import_ms']:8.1f}ms first={r['first_ms']:8.1f}ms "
+            f"mean={r['mean_ms']:8.1f}ms png={r['png_kb']:6.1f}KiB "
+            f"max_rss={r['max_rss_mb']:6.1f}MiB"
+        )
+
+    if len(results) == len(RENDERERS):
+        old, new = results["matplotlib"], results["pillow"]
+        print(
+            f"speedup: {old['mean_ms'] / new['mean_ms']:.1f}x render, "
+            f"{old['import_ms'] / new['import_ms']:.1f}x import, "
+            f"rss {old['max_rss_mb'] - new['max_rss_mb']:.1f}MiB lower"
+        )
+
+
+if __name__ == "__main__":
+    main()
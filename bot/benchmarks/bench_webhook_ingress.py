@@ -0,0 +1,190 @@
+"""
+Load tests the /telegram webhook ingress: the previous Flask app wrapped in
+WsgiToAsgi against the native ASGI app in webhook.py. Each server runs under
+uvicorn in its own subprocess and puts parsed updates on a queue, like
+application.update_queue.
+
+Requires flask[async] and asgiref, which the bot itself no longer depends on.
+
+    python benchmarks/bench_webhook_ingress.py [--requests 5000] [--concurrency 64]
+"""
+
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import subprocess
+
+BOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BOT_DIR)
+
+UPDATE = {
+    "update_id": 100000,
+    "message": {
+        "message_id": 42,
+        "date": 1700000000,
+        "chat": {"id": 12345, "type": "private", "username": "gl"},
+        "from": {"id": 12345, "is_bot": False, "first_name": "GL", "username": "gl"},
+        "location": {"latitude": 1.3343, "longitude": 103.8465},
+    },
+}
+
+
+def old_app(queue, bot):
+    from http import HTTPStatus
+    from asgiref.wsgi import WsgiToAsgi
+    from flask import Flask, Response, request
+    from telegram import Update
+
+    # /telegram as it was before the native ASGI app
+    flask_app = Flask(__name__)
+
+    @flask_app.post("/telegram")
+    async def telegram() -> Response:
+        await queue.put(Update.de_json(data=request.json, bot=bot))
+        return Response(status=HTTPStatus.OK)
+
+    return WsgiToAsgi(flask_app)
+
+
+def new_app(queue, bot):
+    import webhook
+    from webhook import Request, Response
+    from telegram import Update
+
+    web_app = webhook.App()
+
+    @web_app.post("/telegram")
+    async def telegram(request: Request) -> Response:
+        await queue.put(Update.de_json(data=request.json(), bot=bot))
+        return Response()
+
+    return web_app
+
+
+def serve(ingress: str, port: int):
+    import uvicorn
+    from telegram import Bot
+
+    async def run():
+        queue = asyncio.Queue()
+        bot = Bot("123456:benchmark")
+
+        async def drain():
+            while True:
+                await queue.get()
+
+        drainer = asyncio.create_task(drain())
+        app = (old_app if ingress == "old" else new_app)(queue, bot)
+        server = uvicorn.Server(
+            uvicorn.Config(
+                app=app,
+                port=port,
+                host="127.0.0.1",
+                log_level="warning",
+                access_log=False,
+                lifespan="off",
+            )
+        )
+        await server.serve()
+        drainer.cancel()
+
+    asyncio.run(run())
+
+
+async def post(reader, writer, request: bytes) -> int:
+    writer.write(request)
+    status = int((await reader.readline()).split()[1])
+    length = 0
+    while (line := await reader.readline()) != b"\r\n":
+        name, _, value = line.partition(b":")
+        if name.lower() == b"content-length":
+            length = int(value)
+    await reader.readexactly(length)
+    return status
+
+
+async def load(port: int, requests: int, concurrency: int) -> dict:
+    # Raw keep-alive HTTP/1.1 so the client costs less than the servers
+    body = json.dumps(UPDATE).encode()
+    request = (
+        f"POST /telegram HTTP/1.1\r\nHost: 127.0.0.1\r\n"
+        f"Content-Type: application/json\r\nContent-Length: {len(body)}\r\n\r\n"
+    ).encode() + body
+    latencies = []
+    errors = 0
+    remaining = iter(range(requests))
+
+    # Wait for the server to come up
+    for _ in range(100):
+        try:
+            _, writer = await asyncio.open_connection("127.0.0.1", port)
+            writer.close()
+            break
+        except OSError:
+            await asyncio.sleep(0.1)
+
+    async def worker():
+        nonlocal errors
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        for _ in remaining:
+            start = time.perf_counter()
+            try:
+                status = await post(reader, writer, request)
+            except (IndexError, ConnectionError, asyncio.IncompleteReadError):
+                # Server closed the connection, usually after a 500
+                status = None
+                writer.close()
+                reader, writer = await asyncio.open_connection("127.0.0.1", port)
+            if status == 200:
+                latencies.append(time.perf_counter() - start)
+            else:
+                errors += 1
+        writer.close()
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    return {
+        "rps": len(latencies) / elapsed,
+        "errors": errors,
+        "p50": latencies[len(latencies) // 2] * 1000,
+        "p99": latencies[int(len(latencies) * 0.99) - 1] * 1000,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--port", type=int, default=8091)
+    parser.add_argument("--serve", choices=["old", "new"], help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(args.serve, args.port)
+        return
+
+    print(f"{args.requests} webhook POSTs, {args.concurrency} concurrent connections\n")
+    print(f"{'ingress':<24}{'req/s':>10}{'p50 ms':>10}{'p99 ms':>10}{'errors':>8}")
+    for ingress, name in (("old", "Flask + WsgiToAsgi"), ("new", "native ASGI")):
+        server = subprocess.Popen(
+            [sys.executable, __file__, "--serve", ingress, "--port", str(args.port)]
+        )
+        try:
+            result = asyncio.run(load(args.port, args.requests, args.concurrency))
+        finally:
+            server.terminate()
+            server.wait()
+        print(
+            f"{name:<24}{result['rps']:>10.0f}{result['p50']:>10.2f}{result['p99']:>10.2f}"
+            f"{result['errors']:>8}"
+        )
+
+
+if __name__ == "__main__":
+    main()
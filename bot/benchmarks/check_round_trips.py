@@ -0,0 +1,75 @@
+"""
+Checks a recorded update trace against the Firestore round trip budget, so a
+change that adds reads to a command fails CI instead of slowing down a race.
+
+Record a trace with benchmarks/record_round_trips.py (or by running the bot
+with TRACE_FILE set and walking through the commands), then:
+
+    python benchmarks/check_round_trips.py trace.jsonl
+    python benchmarks/check_round_trips.py trace.jsonl --record
+
+--record tightens the budget fixture to the worst case seen per handler.
+Handlers without a recorded budget fall back to TRACE_ROUND_TRIP_BUDGET.
+"""
+
+import os
+import sys
+import json
+import argparse
+from collections import defaultdict
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from constants import TRACE_ROUND_TRIP_BUDGET
+
+BUDGET_PATH = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "round_trip_budget.json"
+)
+
+
+def load_traces(path: str) -> dict[str, list[dict]]:
+    by_handler = defaultdict(list)
+    with open(path) as f:
+        for line in f:
+            if line.strip():
+                trace = json.loads(line)
+                by_handler[trace["handler"]].append(trace)
+    return by_handler
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("trace")
+    parser.add_argument("--budget", default=BUDGET_PATH)
+    parser.add_argument("--record", action="store_true")
+    args = parser.parse_args()
+
+    with open(args.budget) as f:
+        budget = json.load(f)
+    by_handler = load_traces(args.trace)
+
+    if args.record:
+        for handler, traces in by_handler.items():
+            budget["handlers"][handler] = max(t["round_trips"] for t in traces)
+        with open(args.budget, "w") as f:
+            json.dump(budget, f, indent=2, sort_keys=True)
+            f.write("\n")
+        print(f"Recorded budgets for {len(by_handler)} handlers in {args.budget}")
+        return
+
+    failed = False
+    print(f"{'handler':<28}{'updates':>8}{'max':>6}{'budget':>8}")
+    for handler, traces in sorted(by_handler.items()):
+        limit = budget["handlers"].get(handler, TRACE_ROUND_TRIP_BUDGET)
+        worst = max(traces, key=lambda t: t["round_trips"])
+        over = worst["round_trips"] > limit
+        failed |= over
+        print(
+            f"{handler:<28}{len(traces):>8}{worst['round_trips']:>6}{limit:>8}"
+            + (f"  OVER (update {worst['update_id']}: {worst['rpcs']})" if over else "")
+        )
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,338 @@
+"""
+Records a Firestore round trip trace for one GL's /submit -> select challenge
+-> photo -> admin approval -> next location flow, with cold caches.
+
+firebase_util runs against an in-memory Firestore whose operations go through
+the same GAPIC methods the real client uses (get -> batch_get_documents,
+stream -> run_query, writes -> commit), so the counts match production
+round trips. Telegram is faked. The trace is written as JSON lines, in the
+same format TRACE_FILE produces.
+
+    python benchmarks/record_round_trips.py [--out benchmarks/round_trip_trace.jsonl]
+    python benchmarks/check_round_trips.py benchmarks/round_trip_trace.jsonl
+"""
+
+import os
+import sys
+import asyncio
+import argparse
+import datetime
+import itertools
+from types import SimpleNamespace
+
+BOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BOT_DIR)
+
+from google.cloud import firestore as cloud_firestore
+from telegram.constants import ChatType
+
+import firebase_util
+import metrics
+import outbound
+import tracing
+from constants import Role
+from middleware import (
+    dm_only_command,
+    role_restricted_command,
+    race_started_only_command,
+    recent_location_command,
+)
+from challenges import submit_challenge, select_challenge, submit_photo, handle_approval
+
+TRACE_PATH = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "round_trip_trace.jsonl"
+)
+
+GL = "gl_user"
+ADMIN = "admin_user"
+GL_CHAT = 1001
+ADMIN_CHAT = -2002
+
+
+class FakeApi:
+    """Stands in for the GAPIC client, only so metrics can count the calls"""
+
+    def batch_get_documents(self):
+        pass
+
+    def run_query(self):
+        pass
+
+    def commit(self):
+        pass
+
+
+class FakeDocument:
+    def __init__(self, client, collection: str, id: str):
+        self.client = client
+        self.collection = collection
+        self.id = id
+
+    @property
+    def key(self):
+        return (self.collection, self.id)
+
+    def snapshot(self):
+        data = self.client.docs.get(self.key)
+        return SimpleNamespace(
+            id=self.id,
+            exists=data is not None,
+            reference=self,
+            update_time=self.client.now(),
+            to_dict=lambda: dict(data) if data is not None else None,
+            get=lambda field: data[field],
+        )
+
+    def get(self, transaction=None):
+        self.client._firestore_api.batch_get_documents()
+        return self.snapshot()
+
+    def set(self, data: dict):
+        self.client._firestore_api.commit()
+        self.client.docs[self.key] = self.client.apply({}, data)
+        return SimpleNamespace(update_time=self.client.now())
+
+    def update(self, fields: dict):
+        self.client._firestore_api.commit()
+        if self.key not in self.client.docs:
+            raise KeyError(f"No document to update: {self.key}")
+        self.client.docs[self.key] = self.client.apply(
+            self.client.docs[self.key], fields
+        )
+        return SimpleNamespace(update_time=self.client.now())
+
+    def delete(self):
+        self.client._firestore_api.commit()
+        self.client.docs.pop(self.key, None)
+
+
+class FakeCollection:
+    def __init__(self, client, name: str):
+        self.client = client
+        self.name = name
+
+    def document(self, id: str = None):
+        return FakeDocument(
+            self.client, self.name, id or f"auto{next(self.client.ids)}"
+        )
+
+    def refs(self):
+        return [
+            FakeDocument(self.client, self.name, id)
+            for collection, id in list(self.client.docs)
+            if collection == self.name
+        ]
+
+    def stream(self):
+        self.client._firestore_api.run_query()
+        return [ref.snapshot() for ref in self.refs()]
+
+    def on_snapshot(self, callback):
+        # Listeners stream over an open connection, so no round trips here
+        changes = [
+            SimpleNamespace(type=SimpleNamespace(name="ADDED"), document=ref.snapshot())
+            for ref in self.refs()
+        ]
+        callback([change.document for change in changes], changes, self.client.now())
+        return SimpleNamespace(unsubscribe=lambda: None)
+
+
+class FakeClient:
+    def __init__(self, docs: dict):
+        self.docs = docs
+        self.ids = itertools.count(1)
+        self._firestore_api = FakeApi()
+
+    def now(self):
+        return datetime.datetime.now(datetime.timezone.utc)
+
+    def collection(self, name: str):
+        return FakeCollection(self, name)
+
+    def apply(self, data: dict, fields: dict) -> dict:
+        data = dict(data)
+        for key, value in fields.items():
+            if value is cloud_firestore.SERVER_TIMESTAMP:
+                value = self.now()
+            elif isinstance(value, cloud_firestore.ArrayUnion):
+                existing = data.get(key, [])
+                value = existing + [v for v in value.values if v not in existing]
+            elif isinstance(value, cloud_firestore.Increment):
+                value = data.get(key, 0) + value.value
+            data[key] = value
+        return data
+
+
+def seed(client: FakeClient):
+    group = client.collection("groups").document("group1")
+    photo_step = {"type": "Photo", "description": "Take a photo with the statue"}
+    client.docs.update(
+        {
+            ("admins", "_globals"): {"broadcast": ADMIN_CHAT, "broadcast_thread": None},
+            ("admins", ADMIN): {"registered": True},
+            ("users", GL): {"registered": True, "group": group},
+            ("groups", "group1"): {
+                "name": "Group 1",
+                "broadcast_channel": GL_CHAT,
+                "start_time": client.now(),
+                "direction": "A1",
+                "current_location": 0,
+                "challenges_completed": [],
+                "race_completed": False,
+            },
+            ("bonus", "current"): {"idx": -1, "completed": []},
+            ("challenges", "Start"): {
+                "order": 0,
+                "challenges": [
+                    {"description": "Photo with the statue", "steps": [photo_step]}
+                ],
+            },
+            ("challenges", "Next"): {
+                "order": 1,
+                "challenges": [
+                    {"description": "Photo with the statue", "steps": [photo_step]}
+                ],
+            },
+        }
+    )
+
+
+class FakeMessage:
+    def __init__(self, bot, chat_id: int, text: str = None, **kwargs):
+        self.bot = bot
+        self.chat_id = chat_id
+        self.text = text
+        self.caption = kwargs.get("caption")
+        self.reply_markup = kwargs.get("reply_markup")
+
+    async def edit_text(self, text: str, **kwargs):
+        self.text = text
+        return self
+
+    async def edit_caption(self, caption: str, **kwargs):
+        self.caption = caption
+        return self
+
+
+class FakeBot:
+    def __init__(self):
+        self.sent = []
+
+    async def send_message(self, chat_id: int, text: str, **kwargs):
+        message = FakeMessage(self, chat_id, text, **kwargs)
+        self.sent.append(message)
+        return message
+
+    async def send_photo(self, chat_id: int, photo, **kwargs):
+        message = FakeMessage(self, chat_id, **kwargs)
+        self.sent.append(message)
+        return message
+
+
+update_ids = itertools.count(1)
+
+
+def make_update(bot: FakeBot, username: str, chat_id: int, **message_fields):
+    user = SimpleNamespace(id=chat_id, username=username)
+    message = SimpleNamespace(
+        from_user=user,
+        chat=SimpleNamespace(type=ChatType.PRIVATE),
+        chat_id=chat_id,
+        reply_text=lambda text, **kwargs: bot.send_message(chat_id, text, **kwargs),
+        **message_fields,
+    )
+    return SimpleNamespace(
+        update_id=next(update_ids),
+        message=message,
+        edited_message=None,
+        callback_query=None,
+    )
+
+
+def make_query(bot: FakeBot, username: str, chat_id: int, data: str, message=None):
+    async def noop(*args, **kwargs):
+        pass
+
+    update = make_update(bot, username, chat_id)
+    update.callback_query = SimpleNamespace(
+        data=data,
+        from_user=update.message.from_user,
+        message=message,
+        answer=noop,
+        edit_message_text=noop,
+    )
+    return update
+
+
+async def record():
+    client = FakeClient({})
+    seed(client)
+    firebase_util.db = client
+    firebase_util.firestore = SimpleNamespace(firestore=cloud_firestore)
+    metrics.instrument_firestore(client)
+    firebase_util.load_catalog()
+    firebase_util.watch_groups()
+    firebase_util.watch_approvals()
+    firebase_util.queue_location(GL, 1.3343, 103.8465)
+    outbound.start()
+
+    bot = FakeBot()
+    gl_context = SimpleNamespace(bot=bot, user_data={})
+    admin_context = SimpleNamespace(bot=bot, user_data={})
+
+    # Same decorator stack main.py registers for each handler
+    submit = tracing.traced(
+        dm_only_command(
+            role_restricted_command(
+                race_started_only_command(recent_location_command(submit_challenge)),
+                [Role.GL],
+            )
+        ),
+        "entry",
+    )
+    select = tracing.traced(select_challenge, "SelectChallenge")
+    photo = tracing.traced(submit_photo, "SubmitPhoto")
+    approve = tracing.traced(handle_approval, "approval")
+
+    await submit(make_update(bot, GL, GL_CHAT, text="/submit"), gl_context)
+    await select(make_query(bot, GL, GL_CHAT, "0_Start"), gl_context)
+
+    submitting = asyncio.create_task(
+        photo(
+            make_update(bot, GL, GL_CHAT, photo=[SimpleNamespace(file_id="photo1")]),
+            gl_context,
+        )
+    )
+    # Wait for the approval prompt to reach the admin chat, then approve it
+    while not any(m.chat_id == ADMIN_CHAT and m.reply_markup for m in bot.sent):
+        await asyncio.sleep(0.01)
+    prompt = next(m for m in bot.sent if m.chat_id == ADMIN_CHAT and m.reply_markup)
+    await approve(
+        make_query(
+            bot,
+            ADMIN,
+            ADMIN_CHAT,
+            prompt.reply_markup.inline_keyboard[0][0].callback_data,
+            prompt,
+        ),
+        admin_context,
+    )
+    await submitting
+    await outbound.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--out", default=TRACE_PATH)
+    args = parser.parse_args()
+
+    if os.path.exists(args.out):
+        os.remove(args.out)
+    os.environ["TRACE_FILE"] = args.out
+    asyncio.run(record())
+    firebase_util.executor.shutdown(wait=True)
+    print(f"Recorded trace in {args.out}")
+
+
+if __name__ == "__main__":
+    main()
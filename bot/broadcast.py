@@ -0,0 +1,44 @@
+import time
+import asyncio
+import logging
+from telegram import Bot
+from telegram.error import TelegramError
+
+import outbound
+from constants import SendPriority
+
+logger = logging.getLogger("broadcast")
+
+
+async def broadcast(bot: Bot, chat_ids: list[int], text: str, **kwargs) -> list[dict]:
+    start = time.perf_counter()
+
+    async def deliver(chat_id: int) -> dict:
+        # Rate limits and flood control retries are handled by the outbound queue
+        try:
+            await outbound.send_message(
+                SendPriority.Progress, bot, chat_id, text, **kwargs
+            )
+            return {
+                "chat_id": chat_id,
+                "ok": True,
+                "seconds": time.perf_counter() - start,
+            }
+        except TelegramError as e:
+            logger.warning(f"Broadcast to {chat_id} failed: {e}")
+            return {
+                "chat_id": chat_id,
+                "ok": False,
+                "seconds": time.perf_counter() - start,
+            }
+
+    results = await asyncio.gather(*(deliver(chat_id) for chat_id in chat_ids))
+
+    timings = [result["seconds"] for result in results if result["ok"]]
+    if timings:
+        logger.info(
+            f"Broadcast delivered to {len(timings)}/{len(results)} chats: "
+            f"first {min(timings):.3f}s, last {max(timings):.3f}s, "
+            f"spread {max(timings) - min(timings):.3f}s"
+        )
+    return results
@@ -1,3 +1,5 @@
+import time
+import asyncio
 import logging
 from telegram import (
     InlineKeyboardMarkup,
@@ -6,11 +8,12 @@ from telegram import (
     InputMediaPhoto,
 )
 from telegram.ext import ContextTypes, ConversationHandler
-from apscheduler.jobstores.base import JobLookupError
 
 import firebase_util
+import outbound
+import rotation
 from utils import send_challenges, challenge_type_to_conv_state, send_step
-from constants import Role, ConvState, ChallengeType, MAX_BONUS_GROUPS
+from constants import Role, ConvState, ChallengeType, SendPriority, MAX_BONUS_GROUPS
 
 logger = logging.getLogger("challenges")
 
@@ -20,7 +23,7 @@ async def submit_challenge(update: Update, context: ContextTypes.DEFAULT_TYPE) -
         f"@{update.message.from_user.username} attempting to submit a challenge"
     )
 
-    group_info, location, challenge = firebase_util.get_current_challenge(
+    group_info, location, challenge = await firebase_util.get_current_challenge(
         update.message.from_user.username
     )
 
@@ -33,7 +36,7 @@ async def submit_challenge(update: Update, context: ContextTypes.DEFAULT_TYPE) -
         [InlineKeyboardButton(f"Challenge #{i+1}", callback_data=f"{i}_{location}")]
         for [i, chall] in challenge
     ]
-    bonus_idx = firebase_util.has_active_bonus_challenge(
+    bonus_idx = await firebase_util.has_active_bonus_challenge(
         update.message.from_user.username
     )
     if bonus_idx != None:
@@ -50,7 +53,7 @@ async def submit_challenge(update: Update, context: ContextTypes.DEFAULT_TYPE) -
 async def skip_challenge(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     logger.info(f"@{update.message.from_user.username} attempting to SKIP a challenge")
 
-    group_info, location, challenge = firebase_util.get_current_challenge(
+    group_info, location, challenge = await firebase_util.get_current_challenge(
         update.message.from_user.username
     )
 
@@ -112,7 +115,7 @@ async def confirm_skip(update: Update, context: ContextTypes.DEFAULT_TYPE) -> in
     chall_num, chall_loc = query.data.split("_", 1)
     chall_num = int(chall_num)
 
-    challs_left = firebase_util.skip_challenge(
+    challs_left = await firebase_util.skip_challenge(
         query.from_user.username,
         chall_loc,
         chall_num,
@@ -167,15 +170,17 @@ async def post_complete_challenge(
     challs_left: int, username: str, context: ContextTypes.DEFAULT_TYPE
 ):
     if challs_left <= 0:
-        group_info, loc, challenge = firebase_util.next_location(username)
+        group_info, loc, challenge = await firebase_util.next_location(username)
         if not challenge:
-            await context.bot.send_message(
+            outbound.send_message(
+                SendPriority.Progress,
+                context.bot,
                 group_info["broadcast_channel"],
                 "Head back to the endpoint! GO GO GO! The treasure awaits you!",
             )
             return ConversationHandler.END
 
-        await send_challenges(
+        send_challenges(
             context.bot,
             group_info.get("broadcast_channel"),
             loc,
@@ -199,13 +204,16 @@ async def process_next_step(update: Update, context: ContextTypes.DEFAULT_TYPE)
         await send_step(update.message.from_user.id, context, step)
         return challenge_type_to_conv_state(ChallengeType[step["type"]])
 
-    challs_left = firebase_util.complete_challenge(
+    challs_left = await firebase_util.complete_challenge(
         update.message.from_user.username,
         context.user_data.get("challenge_location"),
         context.user_data.get("challenge_number"),
     )
     if context.user_data.get("challenge_location") == "bonus":
-        admin_broadcast, admin_broadcast_thread = firebase_util.get_admin_broadcast()
+        (
+            admin_broadcast,
+            admin_broadcast_thread,
+        ) = await firebase_util.get_admin_broadcast()
         if not challs_left:
             await update.message.reply_text(
                 "Oh no!!! Unfortunately 7 groups have already completed this challenge!"
@@ -213,9 +221,12 @@ async def process_next_step(update: Update, context: ContextTypes.DEFAULT_TYPE)
             return ConversationHandler.END
         else:
             await update.message.reply_text("Bonus challenge completed!")
-        await context.bot.send_message(
+        num_solved = await firebase_util.get_number_solved_bonus()
+        outbound.send_message(
+            SendPriority.Progress,
+            context.bot,
             admin_broadcast,
-            f"Bonus challenge update: {firebase_util.get_number_solved_bonus()}/{MAX_BONUS_GROUPS}",
+            f"Bonus challenge update: {num_solved}/{MAX_BONUS_GROUPS}",
             message_thread_id=admin_broadcast_thread,
         )
         return ConversationHandler.END
@@ -246,11 +257,9 @@ async def submit_text(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int
 def get_approval_content(
     update: Update, context: ContextTypes.DEFAULT_TYPE, step, approval_id
 ):
-    rotating_job = context.user_data.get("job")
+    rotating_frame = rotation.current_frame(context.user_data.get("rotation"))
     rotating_content = (
-        f"\n - Rotation: {rotating_job.data['filenames'][rotating_job.data['idx']].split('/')[-1]}"
-        if rotating_job
-        else ""
+        f"\n - Rotation: {rotating_frame.split('/')[-1]}" if rotating_frame else ""
     )
     return (
         f"Admins! 빨리주세요! Approve @{update.message.from_user.username} submission for {context.user_data.get('challenge_location')} Challenge #{context.user_data.get('challenge_number')} ({step.get('description')}){rotating_content}\n\nRequest ID: {approval_id}",
@@ -295,61 +304,92 @@ async def start_approval_process(
             await update.message.reply_text(
                 f"{len(photos)}/{step['num_photo']} photos received"
             )
-        if len(photos) != step["num_photo"]:
             return ConvState.SubmitPhoto
-
-        approval_id = firebase_util.generate_approval_request()
-        APPROVAL_MESSAGE, APPROVAL_MARKUP = get_approval_content(
-            update, context, step, approval_id
-        )
-        admin_broadcast, admin_broadcast_thread = firebase_util.get_admin_broadcast()
-        await context.bot.send_media_group(
-            admin_broadcast,
-            [InputMediaPhoto(p) for p in photos[:-1]],
-            message_thread_id=admin_broadcast_thread,
-        )
-        approver_captioned_msg = await context.bot.send_photo(
-            admin_broadcast,
-            photos[-1].file_id,
-            caption=APPROVAL_MESSAGE,
-            reply_markup=APPROVAL_MARKUP,
-            message_thread_id=admin_broadcast_thread,
-        )
-        approver_captioned_msg_fn = approver_captioned_msg.edit_text
+        earlier_photos = photos[:-1]
     else:
-        media_id = (
-            update.message.photo[-1].file_id
-            if loop_conv_state == ConvState.SubmitPhoto
-            else update.message.video.file_id
-        )
+        earlier_photos = []
+    approval_id = firebase_util.new_approval_id()
 
-        send_fn = (
-            context.bot.send_photo
-            if loop_conv_state == ConvState.SubmitPhoto
-            else context.bot.send_video
-        )
+    media_id, send_fn = (
+        (update.message.photo[-1].file_id, context.bot.send_photo)
+        if loop_conv_state == ConvState.SubmitPhoto
+        else (update.message.video.file_id, context.bot.send_video)
+    )
+    APPROVAL_MESSAGE, APPROVAL_MARKUP = get_approval_content(
+        update, context, step, approval_id
+    )
 
-        approval_id = firebase_util.generate_approval_request()
-        APPROVAL_MESSAGE, APPROVAL_MARKUP = get_approval_content(
-            update, context, step, approval_id
-        )
+    # Registered before the admins can see the buttons, so no approval is missed
+    approval = firebase_util.register_approval(approval_id)
 
-        admin_broadcast, admin_broadcast_thread = firebase_util.get_admin_broadcast()
-        approver_captioned_msg = await send_fn(
-            admin_broadcast,
-            media_id,
-            caption=APPROVAL_MESSAGE,
-            reply_markup=APPROVAL_MARKUP,
-            message_thread_id=admin_broadcast_thread,
+    start = time.perf_counter()
+    timings = {}
+
+    async def timed(stage: str, awaitable):
+        result = await awaitable
+        timings[stage] = time.perf_counter() - start
+        return result
+
+    async def send_to_admins():
+        admin_broadcast, admin_broadcast_thread = await timed(
+            "admin lookup", firebase_util.get_admin_broadcast()
+        )
+        # Earlier photos go out as one album ahead of the prompt, the chat queue
+        # keeps them in order. Albums need at least two photos
+        if len(earlier_photos) == 1:
+            outbound.enqueue(
+                SendPriority.Approval,
+                admin_broadcast,
+                context.bot.send_photo,
+                admin_broadcast,
+                earlier_photos[0].file_id,
+                message_thread_id=admin_broadcast_thread,
+            )
+        elif earlier_photos:
+            outbound.enqueue(
+                SendPriority.Approval,
+                admin_broadcast,
+                context.bot.send_media_group,
+                admin_broadcast,
+                [InputMediaPhoto(p.file_id) for p in earlier_photos],
+                message_thread_id=admin_broadcast_thread,
+            )
+        return await timed(
+            "admin message",
+            outbound.enqueue(
+                SendPriority.Approval,
+                admin_broadcast,
+                send_fn,
+                admin_broadcast,
+                media_id,
+                caption=APPROVAL_MESSAGE,
+                reply_markup=APPROVAL_MARKUP,
+                message_thread_id=admin_broadcast_thread,
+            ),
         )
-        approver_captioned_msg_fn = approver_captioned_msg.edit_caption
 
-    waiting_msg = await update.message.reply_text(
-        f"Waiting for admin approval...\n\nRequest ID: {approval_id}"
+    # The approval document, the admin message and the reply don't depend on each other
+    try:
+        _, approver_captioned_msg, waiting_msg = await asyncio.gather(
+            timed("approval doc", firebase_util.generate_approval_request(approval_id)),
+            send_to_admins(),
+            timed(
+                "waiting reply",
+                update.message.reply_text(
+                    f"Waiting for admin approval...\n\nRequest ID: {approval_id}"
+                ),
+            ),
+        )
+    except Exception:
+        firebase_util.discard_approval(approval_id)
+        raise
+    logger.info(
+        f"Approval request {approval_id} sent: "
+        + ", ".join(f"{stage} {seconds:.3f}s" for stage, seconds in timings.items())
     )
 
     try:
-        result, approver = await firebase_util.wait_approval(approval_id, 300)
+        result, approver = await firebase_util.wait_approval(approval_id, 300, approval)
         if not result:
             await waiting_msg.edit_text(
                 f"Waiting for admin approval...\n\n(Request ID: {approval_id})\n\nMan, you got rejected by @{approver}... Try sending another one! :("
@@ -361,17 +401,16 @@ async def start_approval_process(
         await waiting_msg.edit_text(
             f"Waiting for admin approval...\n\n(Request ID: {approval_id})\n\nApproval timed out. Call @jloh02 and ask him to pay attention! Then send it again pls"
         )
-        await approver_captioned_msg_fn(
-            f"Haizzz, admins not paying attention... Ask @{update.message.from_user.username} to submit it again"
+        context.user_data.update({"photos": []})
+        outbound.enqueue(
+            SendPriority.Approval,
+            approver_captioned_msg.chat_id,
+            approver_captioned_msg.edit_caption,
+            f"Haizzz, admins not paying attention... Ask @{update.message.from_user.username} to submit it again",
         )
         return loop_conv_state
 
-    job = context.user_data.get("job")
-    if job:
-        try:
-            job.schedule_removal()
-        except JobLookupError:
-            logger.warn("Unknown job ID")
+    rotation.stop_rotation(context.user_data.pop("rotation", None))
     await waiting_msg.edit_text(
         f"Waiting for admin approval... Approved by @{approver}!"
     )
@@ -395,7 +434,7 @@ async def handle_approval(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
     await query.answer()
 
-    role = firebase_util.get_role(query.from_user.username)
+    role = await firebase_util.get_role(query.from_user.username)
     if role != Role.Admin:  # and role != Role.GL:  # TODO Remove GLs
         logger.warn(f"Unauthorized approver: @{query.from_user.username} is a {role}")
         return
@@ -414,6 +453,6 @@ async def handle_approval(update: Update, context: ContextTypes.DEFAULT_TYPE):
     logger.info(
         f"@{query.from_user.username} {'rejected' if status != '1' else 'approved'} request {id} sent by @{gl_username}"
     )
-    firebase_util.update_approval(id, status == "1", query.from_user.username)
+    await firebase_util.update_approval(id, status == "1", query.from_user.username)
 
     return ConversationHandler.END
@@ -7,11 +7,30 @@ MAX_BONUS_GROUPS = 7
 
 END_LAT_LNG = (1.3343111322740955, 103.84651235559575)
 END_TOLERANCE = 30  # m
+CHECKPOINT_RADIUS = 50  # m, for catalog locations without a radius
 
 # Performance tuning
 TELEGRAM_READ_TIMEOUT = 10
 TELEGRAM_WRITE_TIMEOUT = 10
+TELEGRAM_CONNECTION_POOL_SIZE = 256  # Same as the ApplicationBuilder default
 TELEGRAM_CONCURRENT_UPDATES = 16
+FIRESTORE_MAX_WORKERS = TELEGRAM_CONCURRENT_UPDATES
+FIRESTORE_BATCH_SIZE = 500  # Firestore limit on writes per batch
+LOCATION_FLUSH_INTERVAL = 15  # seconds
+ROLE_CACHE_TTL = 300  # seconds
+MEDIA_CACHE_PATH = "media_cache.json"
+ROTATION_TICK_INTERVAL = 1  # seconds
+ROTATION_EDITS_PER_SECOND = 20
+TELEGRAM_MESSAGES_PER_SECOND = 30
+TELEGRAM_CHAT_MESSAGES_PER_SECOND = 1
+TELEGRAM_GROUP_MESSAGES_PER_MINUTE = 20
+TELEGRAM_MAX_RETRIES = 3
+OUTBOUND_WORKERS = 8
+ARRIVAL_CHECK_INTERVAL = 5  # seconds
+WEBHOOK_DEDUP_SIZE = 1000  # update ids
+LOG_BUFFER_SIZE = 2000  # records per level
+LOG_TAIL_QUEUE_SIZE = 1000  # records
+TRACE_ROUND_TRIP_BUDGET = 5  # Firestore RPCs per update before warning
 CONVERSATION_TIMEOUT = 1800  # seconds
 
 
@@ -40,6 +59,12 @@ class ChallengeType(str, Enum):
     Video = "Video"
 
 
+class SendPriority(int, Enum):
+    Approval = 0
+    Progress = 1
+    Rotation = 2
+
+
 class Direction(str, Enum):
     A1 = "A1"
     A0 = "A0"
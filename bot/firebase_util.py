@@ -3,84 +3,286 @@ import json
 import logging
 import asyncio
 import datetime
+import functools
+import threading
+import time
+import contextvars
+from types import MappingProxyType
+from concurrent.futures import ThreadPoolExecutor
+import metrics
+import tracing
 from utils import get_start_chall_index
-import firebase_admin
 from constants import (
     Role,
     Direction,
     RECENT_LOCATION_MAX_TIME,
     NUMBER_LOCATIONS,
     MAX_BONUS_GROUPS,
+    FIRESTORE_MAX_WORKERS,
+    FIRESTORE_BATCH_SIZE,
+    ROLE_CACHE_TTL,
 )
-from firebase_admin import credentials, firestore
 
 db = None
 app = None
+# firebase_admin.firestore is slow to import, so init() loads it
+firestore = None
 broadcast_channel = None
 
 logger = logging.getLogger("firebase")
 
 
 group_cache = {}
-challenge_cache = {}
+# Read-only challenge catalog, rebuilt by load_catalog and reset
+catalog_by_location = MappingProxyType({})
+catalog_by_order = MappingProxyType({})
+catalog_steps = MappingProxyType({})
+# Live copy of the groups collection: group id -> (data, update_time)
+groups_lock = threading.Lock()
+group_mirror = {}
+groups_ready = threading.Event()
+groups_listener = None
+# One listener on approvals resolves every waiting submission
+approvals_lock = threading.Lock()
+pending_approvals = {}
+early_approvals = {}
+# approval id -> set once its document is written, so admin decisions land after it
+approval_docs = {}
+approvals_listener = None
+# username -> (Role, expiry as time.monotonic())
+role_cache = {}
+role_generation = 0
+
+location_lock = threading.Lock()
+# Latest known (GeoPoint, timestamp) per user, fed by queue_location
+location_index = {}
+# Latest unwritten location fix per user, written in batches by flush_locations
+pending_locations = {}
+location_stats = {
+    "received": 0,
+    "coalesced": 0,
+    "flushes": 0,
+    "written": 0,
+    "failed_flushes": 0,
+}
+
+# Firestore calls block, so they run here instead of on the event loop
+executor = ThreadPoolExecutor(
+    max_workers=FIRESTORE_MAX_WORKERS, thread_name_prefix="firebase"
+)
+
+
+def offload(fn):
+    @functools.wraps(fn)
+    async def wrapper(*args, **kwargs):
+        tracing.record_call(fn.__name__)
+        # Run in a copy of the caller's context so RPCs are traced to its update
+        return await asyncio.get_running_loop().run_in_executor(
+            executor,
+            contextvars.copy_context().run,
+            functools.partial(metrics.attributed, fn.__name__, fn, *args, **kwargs),
+        )
+
+    # Blocking version for calls made from inside another offloaded function
+    wrapper.sync = fn
+    return wrapper
 
 
 def init():
-    global app, db
+    global app, db, firestore
+    import firebase_admin
+    from firebase_admin import credentials, firestore
 
     cred = credentials.Certificate(os.environ.get("SERVICE_ACCOUNT_PATH"))
     app = firebase_admin.initialize_app(cred)
     db = firestore.client()
+    metrics.instrument_firestore(db)
+    load_catalog()
+    watch_groups()
+    watch_approvals()
 
 
-def reset():
-    global group_cache, challenge_cache
-    group_cache = {}
-    challenge_cache = {}
-    for doc in db.collection("admins").list_documents():
-        if doc.id == "_globals":
-            continue
-        doc.delete()
+def freeze(value):
+    if isinstance(value, dict):
+        return MappingProxyType({k: freeze(v) for k, v in value.items()})
+    if isinstance(value, list):
+        return tuple(freeze(v) for v in value)
+    return value
+
+
+def build_catalog(docs: dict[str, dict]):
+    global catalog_by_location, catalog_by_order, catalog_steps
+    by_location = freeze(docs)
+    catalog_steps = MappingProxyType(
+        {
+            (location, chall_num): chall["steps"]
+            for location, doc in by_location.items()
+            for chall_num, chall in enumerate(doc["challenges"])
+        }
+    )
+    catalog_by_order = MappingProxyType(
+        {doc["order"]: location for location, doc in docs.items() if "order" in doc}
+    )
+    catalog_by_location = by_location
+
+
+def load_catalog():
+    build_catalog(
+        {doc.id: doc.to_dict() for doc in db.collection("challenges").stream()}
+    )
+    logger.info(f"Loaded {len(catalog_by_location)} challenge locations")
+
+
+def watch_groups():
+    global groups_listener
+    groups_listener = db.collection("groups").on_snapshot(on_groups_snapshot)
+
+
+def on_groups_snapshot(docs, changes, read_time):
+    metrics.inc("firestore_listener_changes_total", len(changes), listener="groups")
+    with groups_lock:
+        for change in changes:
+            doc = change.document
+            if change.type.name == "REMOVED":
+                group_mirror.pop(doc.id, None)
+                continue
+            current = group_mirror.get(doc.id)
+            # Local writes are applied ahead of their snapshot, so never roll back
+            if current and current[1] and doc.update_time < current[1]:
+                continue
+            group_mirror[doc.id] = (doc.to_dict(), doc.update_time)
+    groups_ready.set()
+
+
+def get_group(group_ref: "firestore.firestore.DocumentReference") -> dict | None:
+    if groups_ready.is_set():
+        with groups_lock:
+            entry = group_mirror.get(group_ref.id)
+        if entry:
+            return dict(entry[0])
+    return group_ref.get().to_dict()
+
+
+def update_group(group_ref: "firestore.firestore.DocumentReference", fields: dict):
+    result = group_ref.update(fields)
+    apply_group_update(group_ref.id, fields, result.update_time)
+    return result
+
+
+def apply_group_update(group_id: str, fields: dict, update_time=None):
+    with groups_lock:
+        entry = group_mirror.get(group_id)
+        if not entry:
+            return
+        data, mirror_time = dict(entry[0]), entry[1]
+        # The listener got here first, re-applying an Increment would count it twice
+        if update_time and mirror_time and mirror_time >= update_time:
+            return
+        for key, value in fields.items():
+            if value is firestore.firestore.SERVER_TIMESTAMP:
+                value = update_time or datetime.datetime.now(datetime.timezone.utc)
+            elif isinstance(value, firestore.firestore.ArrayUnion):
+                existing = data.get(key, [])
+                value = existing + [v for v in value.values if v not in existing]
+            elif isinstance(value, firestore.firestore.Increment):
+                value = data.get(key, 0) + value.value
+            data[key] = value
+        group_mirror[group_id] = (data, update_time or mirror_time)
+
+
+def get_reset_documents() -> dict[str, dict[str, dict]]:
+    docs = {
+        "admins": {},
+        "groups": {},
+        "users": {},
+        "challenges": {},
+        "bonus": {},
+        "approvals": {"placeholder": {}},
+    }
     with open("admins.txt") as f:
         for x in list(
             filter(lambda x: len(x), map(lambda x: x.strip(), f.readlines()))
         ):
-            db.collection("admins").document(x).set({"registered": False})
-    for doc in db.collection("groups").list_documents():
-        doc.delete()
-    for doc in db.collection("users").list_documents():
-        doc.delete()
+            docs["admins"][x] = {"registered": False}
     with open("gls.json") as f:
         gl = json.loads(f.read())
         for key in gl:
-            db.collection("groups").document(key).set({"name": key})
+            docs["groups"][key] = {"name": key}
             group_ref = db.collection("groups").document(key)
             for user in gl[key]:
-                db.collection("users").document(user).set(
-                    {"registered": False, "group": group_ref}
-                )
-    for doc in db.collection("challenges").list_documents():
-        doc.delete()
-    for doc in db.collection("bonus").list_documents():
-        doc.delete()
+                docs["users"][user] = {"registered": False, "group": group_ref}
     with open("challenges.json") as f:
         challs = json.loads(f.read())
-        standard_challs = challs["standard"]
-        for key in standard_challs:
-            db.collection("challenges").document(key).set(standard_challs[key])
-        db.collection("challenges").document("bonus").set(challs["bonus"])
-        db.collection("bonus").document("current").set(
-            {"idx": -1, "completed": [-1 for _ in range(MAX_BONUS_GROUPS)]}
+        docs["challenges"].update(challs["standard"])
+        docs["challenges"]["bonus"] = challs["bonus"]
+        docs["bonus"]["current"] = {
+            "idx": -1,
+            "completed": [-1 for _ in range(MAX_BONUS_GROUPS)],
+        }
+    return docs
+
+
+def commit_in_batches(writes: list[tuple]):
+    for i in range(0, len(writes), FIRESTORE_BATCH_SIZE):
+        batch = db.batch()
+        for ref, data in writes[i : i + FIRESTORE_BATCH_SIZE]:
+            if data is None:
+                batch.delete(ref)
+            else:
+                batch.set(ref, data)
+        batch.commit()
+        logger.info(
+            f"Reset progress: {min(i + FIRESTORE_BATCH_SIZE, len(writes))}/{len(writes)} writes committed"
         )
-    for doc in db.collection("approvals").list_documents():
-        doc.delete()
-    db.collection("approvals").document("placeholder").set({})
 
 
+@offload
+def reset(only_changed: bool = False, dry_run: bool = False) -> dict:
+    global group_cache
+    compare = only_changed or dry_run
+    summary = {"written": 0, "deleted": 0, "unchanged": 0}
+    writes = []
+    docs = get_reset_documents()
+    for name, desired in docs.items():
+        collection = db.collection(name)
+        if compare:
+            existing = {doc.id: doc.to_dict() for doc in collection.stream()}
+        else:
+            existing = {doc.id: None for doc in collection.list_documents()}
+        if name == "admins":
+            existing.pop("_globals", None)
+
+        for doc_id in existing.keys() - desired.keys():
+            writes.append((collection.document(doc_id), None))
+            summary["deleted"] += 1
+        for doc_id, data in desired.items():
+            if compare and existing.get(doc_id) == data:
+                summary["unchanged"] += 1
+                continue
+            writes.append((collection.document(doc_id), data))
+            summary["written"] += 1
+
+    logger.info(f"Reset{' (dry run)' if dry_run else ''}: {summary}")
+    if dry_run:
+        return summary
+
+    commit_in_batches(writes)
+    group_cache = {}
+    # Pre-reset fixes must neither pass location checks nor be flushed back
+    with location_lock:
+        pending_locations.clear()
+        location_index.clear()
+    invalidate_role()
+    build_catalog(docs["challenges"])
+    return summary
+
+
+@offload
 def set_broadcast_group(username: str, chatid: int):
-    get_user_group(username).update({"broadcast_channel": chatid})
+    update_group(get_user_group(username), {"broadcast_channel": chatid})
 
 
+@offload
 def get_admin_broadcast() -> int:
     global broadcast_channel
 
@@ -92,20 +294,24 @@ def get_admin_broadcast() -> int:
     return broadcast_channel
 
 
+@offload
 def register_user(username: str, userid: int):
     ref = db.collection("users").document(username)
     if not ref.get().exists:
         return False
     ref.update({"registered": True})
-    set_broadcast_group(username, userid)
+    invalidate_role(username)
+    set_broadcast_group.sync(username, userid)
     return True
 
 
+@offload
 def register_admin(username: str):
     db.collection("admins").document(username).update({"registered": True})
+    invalidate_role(username)
 
 
-def get_user_group(username: str) -> firestore.firestore.DocumentReference:
+def get_user_group(username: str) -> "firestore.firestore.DocumentReference":
     if username in group_cache:
         return group_cache[username]
     group_cache[username] = (
@@ -114,7 +320,30 @@ def get_user_group(username: str) -> firestore.firestore.DocumentReference:
     return group_cache[username]
 
 
-def get_role(username: str) -> Role:
+async def get_role(username: str) -> Role:
+    cached = role_cache.get(username)
+    if cached and cached[1] > time.monotonic():
+        return cached[0]
+
+    generation = role_generation
+    role = await load_role(username)
+    # Skip caching if the role was invalidated while it was being loaded
+    if generation == role_generation:
+        role_cache[username] = (role, time.monotonic() + ROLE_CACHE_TTL)
+    return role
+
+
+def invalidate_role(username: str | None = None):
+    global role_generation
+    role_generation += 1
+    if username:
+        role_cache.pop(username, None)
+    else:
+        role_cache.clear()
+
+
+@offload
+def load_role(username: str) -> Role:
     user = db.collection("users").document(username).get()
     if user.exists and user.to_dict()["registered"]:
         return Role.GL
@@ -124,54 +353,132 @@ def get_role(username: str) -> Role:
     return Role.Unregistered
 
 
-def set_location(username: str, lat: float, lng: float):
-    db.collection("users").document(username).update(
-        {
-            "location": firestore.firestore.GeoPoint(lat, lng),
-            "last_update": firestore.firestore.SERVER_TIMESTAMP,
-        }
-    )
+def queue_location(username: str, lat: float, lng: float):
+    with location_lock:
+        location_stats["received"] += 1
+        if username in pending_locations:
+            location_stats["coalesced"] += 1
+        fix = (
+            firestore.firestore.GeoPoint(lat, lng),
+            datetime.datetime.now(datetime.timezone.utc),
+        )
+        pending_locations[username] = fix
+        location_index[username] = fix
+
 
+@offload
+def flush_locations() -> int:
+    global pending_locations
+    with location_lock:
+        pending, pending_locations = pending_locations, {}
+    if not pending:
+        return 0
 
-def recent_location_update(username: str) -> bool:
-    user = db.collection("users").document(username).get().to_dict()
+    items = list(pending.items())
     try:
-        return (
-            user["location"]
-            and (
-                datetime.datetime.now(datetime.timezone.utc) - user["last_update"]
-            ).total_seconds()
-            < RECENT_LOCATION_MAX_TIME
-        )
-    except KeyError:
-        return False
+        for i in range(0, len(items), FIRESTORE_BATCH_SIZE):
+            batch = db.batch()
+            for username, (location, last_update) in items[
+                i : i + FIRESTORE_BATCH_SIZE
+            ]:
+                # A batch is all or nothing, so a user whose doc is gone must not
+                # fail it. Merging recreates the doc instead, reset cleans it up
+                batch.set(
+                    db.collection("users").document(username),
+                    {"location": location, "last_update": last_update},
+                    merge=True,
+                )
+            batch.commit()
+    except Exception:
+        # Keep unwritten fixes unless a newer one arrived during the flush
+        with location_lock:
+            location_stats["failed_flushes"] += 1
+            for username, fix in pending.items():
+                pending_locations.setdefault(username, fix)
+        raise
 
+    with location_lock:
+        location_stats["flushes"] += 1
+        location_stats["written"] += len(items)
+    logger.debug(f"Flushed {len(items)} locations: {get_location_stats()}")
+    return len(items)
 
-def get_location(username: str) -> bool:
-    user = db.collection("users").document(username).get().to_dict()
-    try:
-        return user["location"]
-    except KeyError:
+
+def get_location_stats() -> dict:
+    with location_lock:
+        return {**location_stats, "buffered": len(pending_locations)}
+
+
+def is_recent(last_update: datetime.datetime) -> bool:
+    return (
+        datetime.datetime.now(datetime.timezone.utc) - last_update
+    ).total_seconds() < RECENT_LOCATION_MAX_TIME
+
+
+@offload
+def load_location(username: str) -> tuple | None:
+    user = db.collection("users").document(username).get().to_dict() or {}
+    if not user.get("location") or not user.get("last_update"):
         return None
+    with location_lock:
+        # A live fix may have arrived while this read was in flight
+        return location_index.setdefault(
+            username, (user["location"], user["last_update"])
+        )
+
+
+async def get_latest_location(username: str) -> tuple | None:
+    fix = location_index.get(username)
+    if fix is None:
+        fix = await load_location(username)
+    return fix
+
+
+async def recent_location_update(username: str) -> bool:
+    fix = await get_latest_location(username)
+    return bool(fix) and is_recent(fix[1])
+
+
+@offload
+def get_racing_groups(usernames: list[str]) -> dict[str, tuple[str, dict]]:
+    groups = {}
+    for username in usernames:
+        try:
+            group_ref = get_user_group(username)
+        except (KeyError, TypeError):
+            continue
+        group = get_group(group_ref)
+        if group and group.get("start_time") and not group.get("end_time"):
+            groups[username] = (group_ref.id, group)
+    return groups
+
 
+async def get_location(username: str):
+    fix = await get_latest_location(username)
+    return fix[0] if fix else None
 
+
+@offload
 def has_race_started(username: str) -> bool:
     try:
-        return bool(get_user_group(username).get().to_dict()["start_time"])
+        return bool(get_group(get_user_group(username))["start_time"])
     except KeyError:
         return False
 
 
+@offload
 def has_race_ended(username: str) -> bool:
     try:
-        return bool(get_user_group(username).get().to_dict()["race_completed"])
+        return bool(get_group(get_user_group(username))["race_completed"])
     except KeyError:
         return False
 
 
+@offload
 def start_race(username: str, direction: Direction) -> dict | None:
     group_ref = get_user_group(username)
-    group_ref.update(
+    update_group(
+        group_ref,
         {
             "start_time": firestore.firestore.SERVER_TIMESTAMP,
             "current_location": get_start_chall_index(direction),
@@ -180,48 +487,43 @@ def start_race(username: str, direction: Direction) -> dict | None:
             "race_completed": False,
             "bonus_completed": 0,
             "challenges_skipped": 0,
-        }
+        },
     )
-    return group_ref.get().to_dict()
+    return get_group(group_ref)
 
 
+@offload
 def end_race(username: str) -> tuple[datetime.datetime]:
     group_ref = get_user_group(username)
-    group_ref.update({"end_time": firestore.firestore.SERVER_TIMESTAMP})
-    data = group_ref.get().to_dict()
+    update_group(group_ref, {"end_time": firestore.firestore.SERVER_TIMESTAMP})
+    data = get_group(group_ref)
     return data["start_time"], data["end_time"]
 
 
+@offload
 def get_current_challenge(username: str) -> tuple[str | dict]:
-    group = get_user_group(username).get().to_dict()
-    for doc in (
-        db.collection("challenges")
-        .where(
-            filter=firestore.firestore.FieldFilter(
-                "order", "==", group["current_location"]
+    group = get_group(get_user_group(username))
+    location = catalog_by_order.get(group["current_location"])
+    if location is None:
+        return None
+    return (
+        group,
+        location,
+        list(
+            filter(
+                lambda iv: iv[0] not in group["challenges_completed"],
+                enumerate(catalog_by_location[location]["challenges"]),
             )
-        )
-        .limit(1)
-        .stream()
-    ):
-        challs = doc.to_dict()["challenges"]
-        return (
-            group,
-            doc.id,
-            list(
-                filter(
-                    lambda iv: iv[0] not in group["challenges_completed"],
-                    enumerate(challs),
-                )
-            ),
-        )
+        ),
+    )
 
 
+@offload
 def next_location(
     username: str,
 ) -> tuple[dict | str | dict] | None:
     group_ref = get_user_group(username)
-    group = group_ref.get().to_dict()
+    group = get_group(group_ref)
     direction = Direction[group["direction"]]
 
     new_location_index = group["current_location"] + (
@@ -237,114 +539,207 @@ def next_location(
         direction
     )  # Loop completed
 
-    group_ref.update(
+    update_group(
+        group_ref,
         {
             "current_location": new_location_index,
             "challenges_completed": [],
             "race_completed": race_completed,
-        }
+        },
     )
 
-    return (group, None, None) if race_completed else get_current_challenge(username)
+    return (
+        (group, None, None) if race_completed else get_current_challenge.sync(username)
+    )
 
 
 def get_challenge(location: str):
-    if not location in challenge_cache:
-        challenge_cache[location] = (
-            db.collection("challenges").document(location).get().to_dict()
-        )
-    return challenge_cache[location]
+    return catalog_by_location.get(location)
 
 
 def get_current_step(
     location: str, challenge_num: int, step_number: int
 ) -> dict | None:
     try:
-        doc = get_challenge(location)
-        return doc["challenges"][challenge_num]["steps"][step_number]
-    except IndexError:
+        return catalog_steps[(location, challenge_num)][step_number]
+    except (KeyError, IndexError):
         return None
 
 
-def complete_challenge(username: str, location: str, chall_num: int) -> bool:
+def claim_bonus(
+    transaction,
+    group_ref: "firestore.firestore.DocumentReference",
+    group_fields: dict,
+) -> bool:
+    bonus_ref = db.collection("bonus").document("current")
+    completed = bonus_ref.get(transaction=transaction).get("completed")
+    if len(completed) >= MAX_BONUS_GROUPS or group_ref.id in completed:
+        return False
+    transaction.update(
+        bonus_ref, {"completed": firestore.firestore.ArrayUnion([group_ref.id])}
+    )
+    transaction.update(group_ref, group_fields)
+    return True
+
+
+@offload
+def complete_challenge(
+    username: str, location: str, chall_num: int, skipped: bool = False
+) -> int | bool:
     group_ref = get_user_group(username)
+    fields = {"challenges_skipped": firestore.firestore.Increment(1)} if skipped else {}
     if location == "bonus":
-        if (
-            len(
-                db.collection("bonus")
-                .document("current")
-                .get()
-                .to_dict()
-                .get("completed")
-            )
-            >= MAX_BONUS_GROUPS
-        ):
-            return False
-        db.collection("bonus").document("current").update(
-            {"completed": firestore.firestore.ArrayUnion([group_ref.id])}
-        )
-        group_ref.update({"bonus_completed": firestore.firestore.Increment(1)})
-        return True
-    group_ref.update(
-        {"challenges_completed": firestore.firestore.ArrayUnion([chall_num])}
-    )
+        fields["bonus_completed"] = firestore.firestore.Increment(1)
+        # Read, cap check and both writes commit together so no extra group gets in
+        transaction = db.transaction()
+        claimed = firestore.transactional(claim_bonus)(transaction, group_ref, fields)
+        if claimed:
+            apply_group_update(group_ref.id, fields, transaction.commit_time)
+        return claimed
+
+    fields["challenges_completed"] = firestore.firestore.ArrayUnion([chall_num])
+    update_group(group_ref, fields)
     return len(get_challenge(location)["challenges"]) - len(
-        group_ref.get().to_dict()["challenges_completed"]
+        get_group(group_ref)["challenges_completed"]
     )
 
 
-def skip_challenge(username: str, location: str, chall_num: int) -> bool:
-    group_ref = get_user_group(username)
-    group_ref.update({"challenges_skipped": firestore.firestore.Increment(1)})
-    return complete_challenge(username, location, chall_num)
+@offload
+def skip_challenge(username: str, location: str, chall_num: int) -> int | bool:
+    return complete_challenge.sync(username, location, chall_num, skipped=True)
 
 
-def generate_approval_request() -> str:
-    update_time, doc = db.collection("approvals").add(
-        {"status": False, "approved": False}
-    )
-    return doc.id
+def new_approval_id() -> str:
+    # Generated client-side, so the id is known before the document is written
+    return db.collection("approvals").document().id
 
 
-async def wait_approval(id: str, timeout: int):
-    output = {"status": False}
-    listener = None
+@offload
+def generate_approval_request(id: str):
+    try:
+        db.collection("approvals").document(id).set(
+            {"status": False, "approved": False}
+        )
+    finally:
+        approval_written(id)
+
+
+def approval_written(id: str):
+    with approvals_lock:
+        written = approval_docs.pop(id, None)
+    if written:
+        written.set()
+
+
+def watch_approvals():
+    global approvals_listener
+    approvals_listener = db.collection("approvals").on_snapshot(on_approvals_snapshot)
+
+
+def on_approvals_snapshot(docs, changes, read_time):
+    metrics.inc("firestore_listener_changes_total", len(changes), listener="approvals")
+    for change in changes:
+        if change.type.name == "REMOVED":
+            with approvals_lock:
+                early_approvals.pop(change.document.id, None)
+            continue
+        status = change.document.to_dict()
+        if status.get("status") and resolve_approval(change.document.id, status):
+            executor.submit(delete_approval.sync, change.document.id)
+
+
+def resolve_approval(id: str, status: dict, keep_early: bool = True) -> bool:
+    with approvals_lock:
+        waiter = pending_approvals.pop(id, None)
+        if not waiter:
+            # Approved before anyone started waiting on it
+            if keep_early:
+                early_approvals[id] = status
+            return False
+    loop, future = waiter
+    loop.call_soon_threadsafe(set_approval_result, future, status)
+    return True
+
+
+def set_approval_result(future: asyncio.Future, status: dict):
+    if not future.done():
+        future.set_result(status)
+
 
-    task_completed_event = asyncio.Event()
+def register_approval(id: str) -> asyncio.Future:
+    loop = asyncio.get_running_loop()
+    with approvals_lock:
+        if id in pending_approvals:
+            return pending_approvals[id][1]
+        future = loop.create_future()
+        approval_docs[id] = threading.Event()
+        status = early_approvals.pop(id, None)
+        if status:
+            future.set_result(status)
+            executor.submit(delete_approval.sync, id)
+        else:
+            pending_approvals[id] = (loop, future)
+    return future
 
-    def update_status(doc_snapshot, changes, read_time):
-        status = doc_snapshot[0].to_dict()
-        if status["status"]:
-            try:
-                if listener:
-                    listener.unsubscribe()
-            except RuntimeError:
-                pass
-            db.collection("approvals").document(id).delete()
-            output.update(status)
-            if output.get("status"):
-                task_completed_event.set()
 
-    listener = db.collection("approvals").document(id).on_snapshot(update_status)
+def discard_approval(id: str):
+    with approvals_lock:
+        pending_approvals.pop(id, None)
+    approval_written(id)
 
+
+@offload
+def delete_approval(id: str):
+    db.collection("approvals").document(id).delete()
+
+
+async def wait_approval(id: str, timeout: int, future: asyncio.Future = None):
+    # Callers that registered early pass their future, it may already be resolved
+    if future is None:
+        future = register_approval(id)
     try:
-        await asyncio.wait_for(task_completed_event.wait(), timeout)
+        status = await asyncio.wait_for(future, timeout)
     except TimeoutError:
+        discard_approval(id)
         try:
-            db.collection("approvals").document(id).delete()
+            await delete_approval(id)
         except RuntimeError:
             pass
         raise TimeoutError
 
-    return output.get("approved"), output.get("approver")
+    return status.get("approved"), status.get("approver")
 
 
-def update_approval(id: str, approved: bool, username: str):
-    db.collection("approvals").document(id).update(
-        {"status": True, "approved": approved, "approver": username}
-    )
+async def update_approval(id: str, approved: bool, username: str):
+    status = {"status": True, "approved": approved, "approver": username}
+    # The submitter is waiting in this process, so skip the Firestore round trip
+    if resolve_approval(id, status, keep_early=False):
+        executor.submit(persist_approval, id, status)
+        return
+    # Otherwise the approvals listener picks this write up
+    await write_approval(id, status)
 
 
+@offload
+def write_approval(id: str, status: dict):
+    db.collection("approvals").document(id).update(status)
+
+
+def persist_approval(id: str, status: dict):
+    # The admin can tap before the request document exists, and writing first
+    # would leave the late create behind as a pending approval nobody deletes
+    with approvals_lock:
+        written = approval_docs.get(id)
+    if written:
+        written.wait()
+    try:
+        write_approval.sync(id, status)
+        delete_approval.sync(id)
+    except Exception:
+        logger.exception(f"Failed to persist approval {id}")
+
+
+@offload
 def get_bonus_status() -> str:
     bonus = db.collection("bonus").document("current").get().to_dict()
     if bonus.get("idx") < 0:
@@ -352,6 +747,7 @@ def get_bonus_status() -> str:
     return f"{len(bonus.get('completed'))}/{MAX_BONUS_GROUPS} completed the previous bonus challenge"
 
 
+@offload
 def get_next_bonus_challenge() -> dict:
     bonus = db.collection("bonus").document("current").get().to_dict()
     idx = bonus.get("idx")
@@ -361,20 +757,20 @@ def get_next_bonus_challenge() -> dict:
             f"Moving next bonus challenge. Previous bonus challenge complete: {bonus.get('completed')}"
         )
     db.collection("bonus").document("current").set({"idx": idx, "completed": []})
-    bonus_challs = (
-        db.collection("challenges").document("bonus").get().to_dict()["challenges"]
-    )
+    bonus_challs = catalog_by_location["bonus"]["challenges"]
     if len(bonus_challs) <= idx:
         return None
     return bonus_challs[idx]
 
 
+@offload
 def get_number_solved_bonus() -> dict:
     return len(
         db.collection("bonus").document("current").get().to_dict().get("completed")
     )
 
 
+@offload
 def has_active_bonus_challenge(username: str, bonus=None) -> dict:
     if bonus == None:
         bonus = db.collection("bonus").document("current").get().to_dict()
@@ -386,26 +782,30 @@ def has_active_bonus_challenge(username: str, bonus=None) -> dict:
     return None
 
 
+@offload
 def get_active_bonus_challenge(username: str) -> dict:
     bonus = db.collection("bonus").document("current").get().to_dict()
-    if not has_active_bonus_challenge(username, bonus):
+    if not has_active_bonus_challenge.sync(username, bonus):
         return None
-    return (
-        db.collection("challenges")
-        .document("bonus")
-        .get()
-        .to_dict()["challenges"][bonus.get("idx")]
-    )
+    return catalog_by_location["bonus"]["challenges"][bonus.get("idx")]
 
 
+@offload
 def get_all_group_status() -> list:
+    if groups_ready.is_set():
+        with groups_lock:
+            return [dict(data) for data, _ in group_mirror.values()]
     return [doc.get().to_dict() for doc in db.collection("groups").list_documents()]
 
 
+@offload
 def get_all_group_broadcast() -> list[int]:
     return list(
         map(
             lambda data: data["broadcast_channel"],
-            filter(lambda data: "broadcast_channel" in data, get_all_group_status()),
+            filter(
+                lambda data: "broadcast_channel" in data,
+                get_all_group_status.sync(),
+            ),
         )
     )
@@ -0,0 +1,166 @@
+import logging
+import numpy as np
+from telegram.ext import ContextTypes
+
+import firebase_util
+import outbound
+from constants import END_LAT_LNG, END_TOLERANCE, CHECKPOINT_RADIUS, SendPriority
+
+logger = logging.getLogger("geofence")
+
+EARTH_RADIUS = 6371008.8  # m, mean radius
+ENDPOINT = "endpoint"
+
+# Catalog the checkpoints were built from, rebuilt when the catalog is reloaded
+checkpoint_source = None
+# name -> {"lat", "lng", "radius"} or {"lat", "lng", "polygon"}
+checkpoints = {}
+# (group id, checkpoint) pairs that were already announced
+arrivals = set()
+
+
+def haversine(lat, lng, lat0, lng0) -> np.ndarray:
+    lat, lng, lat0, lng0 = (np.radians(x) for x in (lat, lng, lat0, lng0))
+    a = (
+        np.sin((lat0 - lat) / 2) ** 2
+        + np.cos(lat) * np.cos(lat0) * np.sin((lng0 - lng) / 2) ** 2
+    )
+    return 2 * EARTH_RADIUS * np.arcsin(np.sqrt(a))
+
+
+def in_polygon(lat, lng, polygon: np.ndarray) -> np.ndarray:
+    # Ray casting, vectorized over the fixes; polygons only have a few vertices
+    lat, lng = np.asarray(lat, dtype=float), np.asarray(lng, dtype=float)
+    inside = np.zeros(np.broadcast(lat, lng).shape, dtype=bool)
+    for (lat1, lng1), (lat2, lng2) in zip(polygon, np.roll(polygon, 1, axis=0)):
+        crosses = (lat1 > lat) != (lat2 > lat)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            edge_lng = (lng2 - lng1) * (lat - lat1) / (lat2 - lat1) + lng1
+        inside ^= crosses & (lng < edge_lng)
+    return inside
+
+
+def make_checkpoint(doc: dict) -> dict | None:
+    if doc.get("polygon"):
+        polygon = np.array([(p.latitude, p.longitude) for p in doc["polygon"]])
+        lat, lng = polygon.mean(axis=0)
+        return {"lat": lat, "lng": lng, "polygon": polygon}
+    if "lat" in doc and "lng" in doc:
+        return {
+            "lat": doc["lat"],
+            "lng": doc["lng"],
+            "radius": doc.get("radius", CHECKPOINT_RADIUS),
+        }
+    return None
+
+
+def get_checkpoints() -> dict:
+    global checkpoint_source, checkpoints
+    if checkpoint_source is not firebase_util.catalog_by_location:
+        checkpoint_source = firebase_util.catalog_by_location
+        checkpoints = {
+            ENDPOINT: {
+                "lat": END_LAT_LNG[0],
+                "lng": END_LAT_LNG[1],
+                "radius": END_TOLERANCE,
+            }
+        }
+        for location, doc in checkpoint_source.items():
+            checkpoint = make_checkpoint(doc)
+            if checkpoint:
+                checkpoints[location] = checkpoint
+        # A reload means a reset, so every group can arrive again
+        arrivals.clear()
+    return checkpoints
+
+
+def contains(checkpoint: dict, lat, lng) -> np.ndarray:
+    if "polygon" in checkpoint:
+        return in_polygon(lat, lng, checkpoint["polygon"])
+    return (
+        haversine(lat, lng, checkpoint["lat"], checkpoint["lng"])
+        <= checkpoint["radius"]
+    )
+
+
+def distance_to(name: str, lat: float, lng: float) -> float:
+    checkpoint = get_checkpoints()[name]
+    return float(haversine(lat, lng, checkpoint["lat"], checkpoint["lng"]))
+
+
+def at_endpoint(lat: float, lng: float) -> bool:
+    return bool(contains(get_checkpoints()[ENDPOINT], lat, lng))
+
+
+def recent_fixes() -> dict:
+    with firebase_util.location_lock:
+        fixes = list(firebase_util.location_index.items())
+    return {
+        username: point
+        for username, (point, last_update) in fixes
+        if firebase_util.is_recent(last_update)
+    }
+
+
+def groups_within(radius: float, lat: float, lng: float) -> list[tuple[str, float]]:
+    # Only GLs share their location, so each username stands for a group
+    fixes = recent_fixes()
+    if not fixes:
+        return []
+    usernames = list(fixes)
+    lats = np.fromiter((p.latitude for p in fixes.values()), float, len(fixes))
+    lngs = np.fromiter((p.longitude for p in fixes.values()), float, len(fixes))
+    distances = haversine(lats, lngs, lat, lng)
+    return [
+        (usernames[i], float(distances[i]))
+        for i in np.argsort(distances)
+        if distances[i] <= radius
+    ]
+
+
+async def detect_arrivals(context: ContextTypes.DEFAULT_TYPE):
+    fixes = recent_fixes()
+    if not fixes:
+        return
+    checkpoints = get_checkpoints()
+    groups = await firebase_util.get_racing_groups(list(fixes))
+
+    pending = []
+    for username, (group_id, group) in groups.items():
+        target = (
+            ENDPOINT
+            if group.get("race_completed")
+            else firebase_util.catalog_by_order.get(group.get("current_location"))
+        )
+        if target in checkpoints and (group_id, target) not in arrivals:
+            pending.append((username, group_id, group, target))
+    if not pending:
+        return
+
+    lats = np.array([fixes[username].latitude for username, *_ in pending])
+    lngs = np.array([fixes[username].longitude for username, *_ in pending])
+    targets = [checkpoints[target] for *_, target in pending]
+    # Radius checkpoints are checked in one pass, polygons one fix at a time
+    arrived = haversine(
+        lats,
+        lngs,
+        np.array([t["lat"] for t in targets]),
+        np.array([t["lng"] for t in targets]),
+    ) <= np.array([t.get("radius", np.inf) for t in targets])
+    for i, target in enumerate(targets):
+        if "polygon" in target:
+            arrived[i] = in_polygon(lats[i], lngs[i], target["polygon"])
+
+    for (username, group_id, group, target), hit in zip(pending, arrived):
+        if not hit:
+            continue
+        arrivals.add((group_id, target))
+        logger.info(f"{group.get('name')} arrived at {target}")
+        outbound.send_message(
+            SendPriority.Progress,
+            context.bot,
+            group.get("broadcast_channel"),
+            "You've made it to the endpoint! Use /endrace to finish the race"
+            if target == ENDPOINT
+            else f"You've arrived at {target}! Use /submit to attempt its challenges",
+        )
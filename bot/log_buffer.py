@@ -0,0 +1,69 @@
+import asyncio
+import logging
+from collections import deque
+
+from constants import LOG_BUFFER_SIZE, LOG_TAIL_QUEUE_SIZE
+
+# Recent formatted records as (logger name, text), WARNING and above go to err
+buffers = {
+    "err": deque(maxlen=LOG_BUFFER_SIZE),
+    "out": deque(maxlen=LOG_BUFFER_SIZE),
+}
+# Live tails as (loop, queue, stream, logger name)
+subscribers = set()
+
+
+def stream_of(record: logging.LogRecord) -> str:
+    return "err" if record.levelno >= logging.WARNING else "out"
+
+
+def matches(name: str, logger_name: str | None) -> bool:
+    return not logger_name or name == logger_name or name.startswith(f"{logger_name}.")
+
+
+class RingBufferHandler(logging.Handler):
+    def emit(self, record: logging.LogRecord):
+        try:
+            text = self.format(record)
+        except Exception:
+            self.handleError(record)
+            return
+        stream = stream_of(record)
+        # deque appends are atomic, so records from executor threads are safe
+        buffers[stream].append((record.name, text))
+        for loop, queue, tail_stream, logger_name in list(subscribers):
+            if tail_stream == stream and matches(record.name, logger_name):
+                loop.call_soon_threadsafe(push, queue, text)
+
+
+def push(queue: asyncio.Queue, text: str):
+    # A slow reader loses lines rather than holding records in memory
+    if not queue.full():
+        queue.put_nowait(text)
+
+
+handler = RingBufferHandler()
+
+
+def recent(stream: str, logger_name: str | None = None, lines: int = 100) -> list:
+    records = [
+        text for name, text in list(buffers[stream]) if matches(name, logger_name)
+    ]
+    return records[-lines:] if lines > 0 else []
+
+
+def get_lines(stream: str, logger_name: str | None = None, lines: int = 100) -> str:
+    return "".join(f"{text}\n" for text in recent(stream, logger_name, lines))
+
+
+async def tail(stream: str, logger_name: str | None = None, lines: int = 0):
+    queue = asyncio.Queue(LOG_TAIL_QUEUE_SIZE)
+    subscriber = (asyncio.get_running_loop(), queue, stream, logger_name)
+    subscribers.add(subscriber)
+    try:
+        for text in recent(stream, logger_name, lines):
+            yield text
+        while True:
+            yield await queue.get()
+    finally:
+        subscribers.discard(subscriber)
@@ -1,7 +1,10 @@
+import startup
 import os
 import logging
+import secrets
 import asyncio
 from dotenv import load_dotenv
+from http import HTTPStatus
 from telegram import (
     Update,
     Bot,
@@ -18,20 +21,28 @@ from telegram.ext import (
 )
 
 import uvicorn
-from http import HTTPStatus
-from flask_cors import CORS
-from asgiref.wsgi import WsgiToAsgi
-from flask import Flask, Response, make_response, request
 
 from constants import (
     Role,
     ConvState,
     TELEGRAM_READ_TIMEOUT,
     TELEGRAM_WRITE_TIMEOUT,
+    TELEGRAM_CONNECTION_POOL_SIZE,
     TELEGRAM_CONCURRENT_UPDATES,
     CONVERSATION_TIMEOUT,
+    LOCATION_FLUSH_INTERVAL,
+    ROTATION_TICK_INTERVAL,
+    ARRIVAL_CHECK_INTERVAL,
+    SendPriority,
 )
 import firebase_util
+import log_buffer
+import metrics
+import tracing
+import outbound
+import rotation
+import webhook
+from webhook import Request, Response, StreamingResponse
 from middleware import (
     dm_only_command,
     role_context_command,
@@ -58,14 +69,15 @@ from challenges import (
     handle_approval,
 )
 from bonus import start_bonus, confirm_bonus
-from misc_commands import end_race, get_status
-from utils import get_logs
+from misc_commands import end_race, get_status, get_nearby
 
+startup.mark("imports")
 load_dotenv()
-firebase_util.init()
 
 logging.basicConfig(
-    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s", level=logging.INFO
+    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
+    level=logging.INFO,
+    handlers=[logging.StreamHandler(), log_buffer.handler],
 )
 logging.getLogger("httpx").setLevel(logging.WARNING)
 logging.getLogger("apscheduler.scheduler").setLevel(logging.WARNING)
@@ -76,7 +88,7 @@ logger = logging.getLogger("main")
 
 async def location(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     message = update.message if update.message else update.edited_message
-    firebase_util.set_location(
+    firebase_util.queue_location(
         message.from_user.username,
         message.location.latitude,
         message.location.longitude,
@@ -84,6 +96,22 @@ async def location(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     return ConversationHandler.END
 
 
+async def flush_locations(context: ContextTypes.DEFAULT_TYPE):
+    try:
+        await firebase_util.flush_locations()
+    except Exception:
+        logger.exception(
+            f"Failed to flush locations: {firebase_util.get_location_stats()}"
+        )
+
+
+async def detect_arrivals(context: ContextTypes.DEFAULT_TYPE):
+    # Imported on the first check so numpy stays off the startup path
+    import geofence
+
+    await geofence.detect_arrivals(context)
+
+
 async def cancel(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     await update.message.reply_text("Operation cancelled")
     return ConversationHandler.END
@@ -92,11 +120,15 @@ async def cancel(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
 async def reset(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     logger.info(f"@{update.message.from_user.username} resetted the game state")
 
-    admin_broadcast, admin_broadcast_thread = firebase_util.get_admin_broadcast()
+    admin_broadcast, admin_broadcast_thread = await firebase_util.get_admin_broadcast()
 
-    firebase_util.reset()
-    await update.message.reply_text("Resetted game state")
-    await context.bot.send_message(
+    summary = await firebase_util.reset()
+    await update.message.reply_text(
+        f"Resetted game state ({summary['written']} written, {summary['deleted']} deleted)"
+    )
+    outbound.send_message(
+        SendPriority.Progress,
+        context.bot,
         admin_broadcast,
         f"@{update.message.from_user.username} resetted game state",
         message_thread_id=admin_broadcast_thread,
@@ -105,11 +137,22 @@ async def reset(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
 
 
 async def main() -> None:
+    # Firestore setup runs alongside the Telegram API calls below
+    firebase_ready = asyncio.get_running_loop().run_in_executor(
+        None, startup.timed("firebase init", firebase_util.init)
+    )
+
     application = (
         Application.builder()
         .token(os.environ.get("TELEGRAM_BOT_KEY"))
-        .read_timeout(TELEGRAM_READ_TIMEOUT)
-        .write_timeout(TELEGRAM_WRITE_TIMEOUT)
+        # Timeouts live on the request now that the builder doesn't create it
+        .request(
+            metrics.TelegramRequest(
+                connection_pool_size=TELEGRAM_CONNECTION_POOL_SIZE,
+                read_timeout=TELEGRAM_READ_TIMEOUT,
+                write_timeout=TELEGRAM_WRITE_TIMEOUT,
+            )
+        )
         .concurrent_updates(TELEGRAM_CONCURRENT_UPDATES)
         .build()
     )
@@ -126,6 +169,7 @@ async def main() -> None:
             BotCommand("cancel", "Cancel the command. Also use when bot hangs"),
         ]
     )
+    startup.mark("build application")
 
     conv_handler = ConversationHandler(
         entry_points=[
@@ -189,6 +233,10 @@ async def main() -> None:
                     )
                 ),
             ),
+            CommandHandler(
+                "nearby",
+                dm_only_command(role_restricted_command(get_nearby, [Role.Admin])),
+            ),
             MessageHandler(
                 filters.LOCATION,
                 dm_only_command(
@@ -217,75 +265,182 @@ async def main() -> None:
         fallbacks=[CommandHandler("cancel", cancel)],
         conversation_timeout=CONVERSATION_TIMEOUT,
     )
+    for state, handlers in [
+        ("entry", conv_handler.entry_points),
+        ("fallback", conv_handler.fallbacks),
+        *((state.value, handlers) for state, handlers in conv_handler.states.items()),
+    ]:
+        for handler in handlers:
+            handler.callback = metrics.instrument(
+                tracing.traced(handler.callback, state), state
+            )
     application.add_handler(conv_handler)
-    application.add_handler(CallbackQueryHandler(handle_approval, r"chall\|.*"))
+    application.add_handler(
+        CallbackQueryHandler(
+            metrics.instrument(tracing.traced(handle_approval, "approval"), "approval"),
+            r"chall\|.*",
+        )
+    )
+    application.job_queue.run_repeating(flush_locations, LOCATION_FLUSH_INTERVAL)
+    application.job_queue.run_repeating(rotation.tick, ROTATION_TICK_INTERVAL)
+    application.job_queue.run_repeating(detect_arrivals, ARRIVAL_CHECK_INTERVAL)
+    startup.mark("register handlers")
+
+    # CORS is only needed for local development against the polling bot
+    web_app = webhook.App(cors=not os.environ.get("WEBHOOK_URL"))
+
+    # Telegram echoes this back on every webhook call, anything without it is forged
+    webhook_secret = os.environ.get("WEBHOOK_SECRET") or secrets.token_urlsafe(32)
 
-    flask_app = Flask(__name__)
+    @web_app.post("/telegram")
+    async def telegram(request: Request) -> Response:
+        # Cheap checks first, so forged and redelivered updates are never parsed
+        if not webhook.valid_secret(request, webhook_secret):
+            return Response(status=HTTPStatus.FORBIDDEN)
+        try:
+            data = request.json()
+        except ValueError:
+            return Response(status=HTTPStatus.BAD_REQUEST)
+        if not isinstance(data, dict) or not isinstance(data.get("update_id"), int):
+            return Response(status=HTTPStatus.BAD_REQUEST)
+        update_id = data["update_id"]
+        if not webhook.first_delivery(update_id):
+            logger.info(f"Dropped duplicate update {update_id}")
+            return Response()
 
-    @flask_app.post("/telegram")
-    async def telegram() -> Response:
-        await application.update_queue.put(
-            Update.de_json(data=request.json, bot=application.bot)
+        startup.first_update()
+        try:
+            await application.update_queue.put(
+                Update.de_json(data=data, bot=application.bot)
+            )
+        except BaseException:
+            webhook.forget(update_id)
+            raise
+        return Response()
+
+    metrics.gauge(
+        "telegram_update_queue_depth",
+        application.update_queue.qsize,
+        "Updates waiting to be processed",
+    )
+    for priority in SendPriority:
+        metrics.gauge(
+            "outbound_queue_depth",
+            lambda priority=priority: outbound.get_stats()["depth"][priority.name],
+            "Outgoing messages waiting to be sent",
+            priority=priority.name,
+        )
+    for stat, name, help in [
+        ("received", "locations_received_total", "Live location updates received"),
+        ("coalesced", "locations_coalesced_total", "Locations replaced before flush"),
+        ("written", "locations_written_total", "Locations written to Firestore"),
+        ("flushes", "location_flushes_total", "Location buffer flushes"),
+        ("failed_flushes", "location_failed_flushes_total", "Flushes retried later"),
+    ]:
+        metrics.counter(
+            name,
+            lambda stat=stat: firebase_util.get_location_stats()[stat],
+            help,
         )
-        return Response(status=HTTPStatus.OK)
-
-    @flask_app.get("/ping")
-    async def ping() -> Response:
-        response = make_response("pong", HTTPStatus.OK)
-        response.mimetype = "text/plain"
-        return response
-
-    @flask_app.get("/logs/err")
-    async def logs_err() -> Response:
-        response = make_response(get_logs(True), HTTPStatus.OK)
-        response.mimetype = "text/plain"
-        return response
-
-    @flask_app.get("/logs/out")
-    async def logs_out() -> Response:
-        response = make_response(get_logs(False), HTTPStatus.OK)
-        response.mimetype = "text/plain"
-        return response
+    metrics.gauge(
+        "location_buffer_depth",
+        lambda: firebase_util.get_location_stats()["buffered"],
+        "Locations waiting for the next flush",
+    )
+    metrics.gauge(
+        "rotation_active",
+        rotation.active_rotations,
+        "Photo rotations currently running",
+    )
+
+    @web_app.get("/metrics")
+    async def get_metrics(request: Request) -> Response:
+        return Response(metrics.render(), content_type="text/plain; version=0.0.4")
+
+    @web_app.get("/ping")
+    async def ping(request: Request) -> Response:
+        return Response("pong")
+
+    def serve_logs(stream: str, request: Request) -> Response | StreamingResponse:
+        # ?logger=challenges to filter, ?follow=1 to keep streaming new records
+        logger_name = request.query.get("logger")
+        try:
+            lines = int(request.query.get("lines", 100))
+        except ValueError:
+            return Response("lines must be a number", status=HTTPStatus.BAD_REQUEST)
+        if request.query.get("follow"):
+            return StreamingResponse(
+                webhook.server_sent_events(log_buffer.tail(stream, logger_name, lines)),
+                content_type="text/event-stream",
+            )
+        return Response(log_buffer.get_lines(stream, logger_name, lines))
+
+    @web_app.get("/logs/err")
+    async def logs_err(request: Request) -> Response | StreamingResponse:
+        return serve_logs("err", request)
+
+    @web_app.get("/logs/out")
+    async def logs_out(request: Request) -> Response | StreamingResponse:
+        return serve_logs("out", request)
 
     if os.environ.get("WEBHOOK_URL"):
         webserver = uvicorn.Server(
             config=uvicorn.Config(
-                app=WsgiToAsgi(flask_app),
+                app=web_app,
                 port=8080,
                 use_colors=False,
                 host="0.0.0.0",
+                lifespan="off",
+                timeout_graceful_shutdown=5,
             )
         )
 
         await application.bot.set_webhook(
             url=f"{os.environ.get('WEBHOOK_URL')}/telegram",
             allowed_updates=Update.ALL_TYPES,
+            secret_token=webhook_secret,
         )
+        startup.mark("set webhook")
+        await firebase_ready
+        startup.mark("wait for firebase")
         async with application:
             await application.initialize()
             await application.start()
+            outbound.start()
+            startup.mark("start application")
+            startup.report()
             await webserver.serve()
+            await outbound.stop()
             await application.stop()
+            await firebase_util.flush_locations()
             await application.shutdown()
 
     else:
         webserver = uvicorn.Server(
             config=uvicorn.Config(
-                app=WsgiToAsgi(flask_app),
+                app=web_app,
                 port=8080,
                 use_colors=False,
                 host="127.0.0.1",
+                lifespan="off",
+                timeout_graceful_shutdown=5,
             )
         )
-        CORS(flask_app)
+        await firebase_ready
+        startup.mark("wait for firebase")
 
         async with application:
             await application.initialize()
             await application.start()
+            outbound.start()
             await application.updater.start_polling(allowed_updates=Update.ALL_TYPES)
+            startup.mark("start application")
+            startup.report()
             await webserver.serve()
             await application.updater.stop()
+            await outbound.stop()
             await application.stop()
+            await firebase_util.flush_locations()
             await application.shutdown()
 
 
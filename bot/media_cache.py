@@ -0,0 +1,119 @@
+import os
+import json
+import asyncio
+import hashlib
+import logging
+from telegram import Bot, Message, InputMediaPhoto
+from telegram.error import BadRequest
+
+from constants import MEDIA_CACHE_PATH
+
+logger = logging.getLogger("media")
+
+# "<bot id>:<path>:<sha256>" -> Telegram file_id, persisted to MEDIA_CACHE_PATH
+file_ids = None
+# path -> (mtime_ns, size, sha256) so unchanged files are hashed once
+digests = {}
+upload_locks = {}
+# directory -> sorted frame paths, shared by every group on a rotating step
+rotation_sets = {}
+
+
+def load():
+    global file_ids
+    try:
+        with open(MEDIA_CACHE_PATH) as f:
+            file_ids = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        file_ids = {}
+
+
+def save():
+    tmp_path = MEDIA_CACHE_PATH + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(file_ids, f, indent=2)
+    os.replace(tmp_path, MEDIA_CACHE_PATH)
+
+
+def file_digest(path: str) -> str:
+    stat = os.stat(path)
+    cached = digests.get(path)
+    if cached and cached[:2] == (stat.st_mtime_ns, stat.st_size):
+        return cached[2]
+    with open(path, "rb") as f:
+        digest = hashlib.sha256(f.read()).hexdigest()
+    digests[path] = (stat.st_mtime_ns, stat.st_size, digest)
+    return digest
+
+
+def media_key(bot: Bot, path: str) -> str:
+    # file_ids are only valid for the bot that uploaded them
+    return f"{bot.id}:{path}:{file_digest(path)}"
+
+
+def get_file_id(bot: Bot, path: str) -> str | None:
+    if file_ids is None:
+        load()
+    return file_ids.get(media_key(bot, path))
+
+
+def remember(bot: Bot, path: str, message: Message) -> str:
+    if file_ids is None:
+        load()
+    file_id = message.photo[-1].file_id
+    file_ids[media_key(bot, path)] = file_id
+    save()
+    return file_id
+
+
+def forget(bot: Bot, path: str):
+    if file_ids is None:
+        load()
+    if file_ids.pop(media_key(bot, path), None):
+        save()
+
+
+def get_rotation_set(directory: str) -> tuple[str]:
+    if directory not in rotation_sets:
+        rotation_sets[directory] = tuple(
+            os.path.join(directory, name) for name in sorted(os.listdir(directory))
+        )
+    return rotation_sets[directory]
+
+
+async def edit_photo(message: Message, path: str, **kwargs) -> Message:
+    bot = message.get_bot()
+    file_id = get_file_id(bot, path)
+    if file_id:
+        try:
+            return await message.edit_media(InputMediaPhoto(file_id, **kwargs))
+        except BadRequest:
+            logger.warning(f"Cached file_id for {path} rejected, uploading again")
+            forget(bot, path)
+
+    with open(path, "rb") as f:
+        edited = await message.edit_media(InputMediaPhoto(f, **kwargs))
+    remember(bot, path, edited)
+    logger.info(f"Uploaded {path}")
+    return edited
+
+
+async def send_photo(bot: Bot, chat_id: int, path: str, **kwargs) -> Message:
+    file_id = get_file_id(bot, path)
+    if file_id:
+        try:
+            return await bot.send_photo(chat_id, file_id, **kwargs)
+        except BadRequest:
+            logger.warning(f"Cached file_id for {path} rejected, uploading again")
+            forget(bot, path)
+
+    # Groups reaching the same step together share one upload
+    async with upload_locks.setdefault(path, asyncio.Lock()):
+        file_id = get_file_id(bot, path)
+        if file_id:
+            return await bot.send_photo(chat_id, file_id, **kwargs)
+        with open(path, "rb") as f:
+            message = await bot.send_photo(chat_id, f, **kwargs)
+        remember(bot, path, message)
+        logger.info(f"Uploaded {path}")
+        return message
@@ -0,0 +1,170 @@
+import time
+import bisect
+import functools
+import threading
+import contextvars
+from collections import defaultdict
+from telegram.request import HTTPXRequest
+
+import tracing
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+FIRESTORE_RPCS = {
+    "batch_get_documents": "read",
+    "run_query": "read",
+    "run_aggregation_query": "read",
+    "list_documents": "read",
+    "list_collection_ids": "read",
+    "commit": "write",
+    "batch_write": "write",
+    "begin_transaction": "transaction",
+    "rollback": "transaction",
+}
+
+# Counters are bumped from executor and listener threads too
+lock = threading.Lock()
+# (name, labels) -> value
+counters = defaultdict(float)
+# (name, labels) -> [count per bucket, ..., sum, count]
+histograms = {}
+# name -> [(labels, callback)]
+gauges = defaultdict(list)
+# name -> (type, help)
+descriptions = {
+    "handler_seconds": ("histogram", "Handler latency by conversation state"),
+    "telegram_api_seconds": ("histogram", "Telegram Bot API request latency"),
+    "firestore_rpcs_total": ("counter", "Firestore RPCs by firebase_util function"),
+    "firestore_listener_changes_total": ("counter", "Document changes per listener"),
+}
+
+# firebase_util function the current thread is running on behalf of
+firestore_caller = contextvars.ContextVar("firestore_caller", default="other")
+
+
+def labels_key(labels: dict) -> tuple:
+    return tuple(sorted(labels.items()))
+
+
+def inc(name: str, value: float = 1, **labels):
+    with lock:
+        counters[(name, labels_key(labels))] += value
+
+
+def observe(name: str, seconds: float, **labels):
+    key = (name, labels_key(labels))
+    with lock:
+        if key not in histograms:
+            histograms[key] = [0] * (len(LATENCY_BUCKETS) + 3)
+        histogram = histograms[key]
+        histogram[bisect.bisect_left(LATENCY_BUCKETS, seconds)] += 1
+        histogram[-2] += seconds
+        histogram[-1] += 1
+
+
+def gauge(name: str, callback, help: str, **labels):
+    descriptions[name] = ("gauge", help)
+    gauges[name].append((labels_key(labels), callback))
+
+
+def counter(name: str, callback, help: str, **labels):
+    # For totals another module already keeps, read at scrape time like a gauge
+    gauge(name, callback, help, **labels)
+    descriptions[name] = ("counter", help)
+
+
+def format_labels(labels: tuple, **extra) -> str:
+    pairs = [*labels, *extra.items()]
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{key}="{value}"' for key, value in pairs) + "}"
+
+
+def render() -> str:
+    with lock:
+        counter_items = sorted(counters.items())
+        histogram_items = sorted(
+            (key, list(values)) for key, values in histograms.items()
+        )
+
+    samples = defaultdict(list)
+    for (name, labels), value in counter_items:
+        samples[name].append(f"{name}{format_labels(labels)} {value:g}")
+    for (name, labels), values in histogram_items:
+        cumulative = 0
+        for le, count in zip((*LATENCY_BUCKETS, "+Inf"), values):
+            cumulative += count
+            samples[name].append(
+                f"{name}_bucket{format_labels(labels, le=le)} {cumulative}"
+            )
+        samples[name].append(f"{name}_sum{format_labels(labels)} {values[-2]:g}")
+        samples[name].append(f"{name}_count{format_labels(labels)} {values[-1]}")
+    for name, callbacks in gauges.items():
+        for labels, callback in callbacks:
+            samples[name].append(f"{name}{format_labels(labels)} {callback():g}")
+
+    lines = []
+    for name in sorted(samples):
+        kind, help = descriptions.get(name, ("untyped", name))
+        lines += [f"# HELP {name} {help}", f"# TYPE {name} {kind}", *samples[name]]
+    return "\n".join(lines) + "\n"
+
+
+def instrument(callback, state: str):
+    @functools.wraps(callback)
+    async def fn(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return await callback(*args, **kwargs)
+        finally:
+            observe(
+                "handler_seconds",
+                time.perf_counter() - start,
+                state=state,
+                handler=callback.__name__,
+            )
+
+    return fn
+
+
+def attributed(caller: str, fn, *args, **kwargs):
+    token = firestore_caller.set(caller)
+    try:
+        return fn(*args, **kwargs)
+    finally:
+        firestore_caller.reset(token)
+
+
+def instrument_firestore(client):
+    api = client._firestore_api
+
+    def counted(rpc: str, kind: str, method):
+        @functools.wraps(method)
+        def fn(*args, **kwargs):
+            inc(
+                "firestore_rpcs_total",
+                function=firestore_caller.get(),
+                rpc=rpc,
+                kind=kind,
+            )
+            tracing.record_rpc(firestore_caller.get(), kind)
+            return method(*args, **kwargs)
+
+        return fn
+
+    for rpc, kind in FIRESTORE_RPCS.items():
+        if hasattr(api, rpc):
+            setattr(api, rpc, counted(rpc, kind, getattr(api, rpc)))
+
+
+class TelegramRequest(HTTPXRequest):
+    async def do_request(self, url: str, method: str, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return await super().do_request(url, method, *args, **kwargs)
+        finally:
+            observe(
+                "telegram_api_seconds",
+                time.perf_counter() - start,
+                method=url.rsplit("/", 1)[-1],
+            )
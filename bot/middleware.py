@@ -1,3 +1,4 @@
+import functools
 import firebase_util
 from constants import Role
 from telegram.ext import ContextTypes, ConversationHandler
@@ -7,6 +8,7 @@ from telegram.constants import ChatType
 
 
 def dm_only_command(callback, quiet=False) -> SCT:
+    @functools.wraps(callback)
     async def fn(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
         message = update.message if update.message else update.edited_message
         if message.chat.type != ChatType.PRIVATE:
@@ -19,17 +21,24 @@ def dm_only_command(callback, quiet=False) -> SCT:
 
 
 def role_context_command(callback) -> SCT:
+    @functools.wraps(callback)
     async def fn(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
-        message = update.message if update.message else update.edited_message
-        context.user_data.update(
-            {"role": firebase_util.get_role(message.from_user.username)}
-        )
+        # Nested decorators share one lookup per update
+        if context.user_data.get("role_update_id") != update.update_id:
+            message = update.message if update.message else update.edited_message
+            context.user_data.update(
+                {
+                    "role": await firebase_util.get_role(message.from_user.username),
+                    "role_update_id": update.update_id,
+                }
+            )
         return await callback(update, context)
 
     return fn
 
 
 def role_restricted_command(callback, allow: list[Role], quiet=False) -> SCT:
+    @functools.wraps(callback)
     async def fn(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
         message = update.message if update.message else update.edited_message
         if not context.user_data.get("role") in allow:
@@ -44,9 +53,10 @@ def role_restricted_command(callback, allow: list[Role], quiet=False) -> SCT:
 
 
 def race_started_only_command(callback) -> SCT:
+    @functools.wraps(callback)
     async def fn(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
         message = update.message if update.message else update.edited_message
-        if not firebase_util.has_race_started(message.from_user.username):
+        if not await firebase_util.has_race_started(message.from_user.username):
             await message.reply_text(
                 "The race hasn't started! What are you doing? Stop trying to hack me plsss!"
             )
@@ -57,8 +67,11 @@ def race_started_only_command(callback) -> SCT:
 
 
 def recent_location_command(callback) -> SCT:
+    @functools.wraps(callback)
     async def fn(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
-        if not firebase_util.recent_location_update(update.message.from_user.username):
+        if not await firebase_util.recent_location_update(
+            update.message.from_user.username
+        ):
             await update.message.reply_text("Please ensure your location is updated!")
             return ConversationHandler.END
         return await callback(update, context)
@@ -1,40 +1,49 @@
+import json
+import asyncio
+import hashlib
 import logging
-from io import BytesIO
-from geopy import distance
-import matplotlib.pyplot as plt
-from matplotlib.font_manager import FontProperties
 from telegram import Update, InputFile
+from telegram.error import BadRequest
 from telegram.ext import (
     ContextTypes,
     ConversationHandler,
 )
 
 import firebase_util
-from constants import Direction, END_LAT_LNG, END_TOLERANCE, NUMBER_LOCATIONS
+from constants import Direction, NUMBER_LOCATIONS, CHECKPOINT_RADIUS
 from utils import get_start_chall_index
 
 logger = logging.getLogger("misc")
 
+# Last uploaded /status table, reused until group progress changes
+status_cache = {"digest": None, "file_id": None}
+status_lock = asyncio.Lock()
+
 
 async def end_race(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
-    if not firebase_util.has_race_ended(update.message.from_user.username):
+    if not await firebase_util.has_race_ended(update.message.from_user.username):
         await update.message.reply_text("Finish your challenges first!")
         return ConversationHandler.END
     logger.info(f"@{update.message.from_user.username} ending race")
-    location = firebase_util.get_location(update.message.from_user.username)
+    location = await firebase_util.get_location(update.message.from_user.username)
     if not location:
         await update.message.reply_text(
             "Location not found, please make sure your location is on"
         )
         return ConversationHandler.END
 
-    d = distance.geodesic((location.latitude, location.longitude), END_LAT_LNG).m
+    # numpy is only needed once a group reaches the end, keep it off startup
+    import geofence
+
+    d = geofence.distance_to(geofence.ENDPOINT, location.latitude, location.longitude)
     logger.info(f"@{update.message.from_user.username} distance from endpoint: {d}m")
-    if d > END_TOLERANCE:
+    if not geofence.at_endpoint(location.latitude, location.longitude):
         await update.message.reply_text("You're too far from the endpoint!")
         return ConversationHandler.END
 
-    start_time, end_time = firebase_util.end_race(update.message.from_user.username)
+    start_time, end_time = await firebase_util.end_race(
+        update.message.from_user.username
+    )
     duration_in_s = (end_time - start_time).total_seconds()
     logger.info(
         f"@{update.message.from_user.username} finished race at {end_time} (Duration: {duration_in_s} seconds)"
@@ -83,40 +92,69 @@ def get_progress_str_with_name(group: dict) -> int:
 
 
 def create_table(data):
-    fig, ax = plt.subplots(figsize=(10, 10))
-    # ax.axis("tight")
-    table = ax.table(
-        cellText=data,
-        colLabels=["Group", "Status"],
-        cellLoc="center",
-        loc="center",
-        bbox=[0, 0, 1, 1],
-    )
-    fig.tight_layout()
-
-    for (row, col), cell in table.get_celld().items():
-        cell.PAD = 0.5
-        if (row == 0) or (col == -1):
-            cell.set_text_props(fontproperties=FontProperties(weight="bold"))
-
-    ax.axis("off")
-    table.auto_set_font_size(False)
-    table.set_fontsize(14)
-    table.auto_set_column_width(col=list(range(2)))
-
-    # Save the table as an image in memory
-    buffer = BytesIO()
-    plt.savefig(buffer, format="png")
-    buffer.seek(0)
-    plt.close()
+    from table_renderer import render_table
+
+    return render_table(["Group", "Status"], data)
+
+
+async def get_nearby(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    # /nearby <checkpoint> [radius in m], which GLs are around a checkpoint right now
+    import geofence
+
+    args = list(context.args or [])
+    radius = None
+    if len(args) > 1:
+        try:
+            radius = float(args[-1])
+            args.pop()
+        except ValueError:
+            pass
+    name = " ".join(args)
+    checkpoints = geofence.get_checkpoints()
+    if name not in checkpoints:
+        await update.message.reply_text(
+            "Usage: /nearby <checkpoint> [radius in m]\n\nCheckpoints: "
+            + ", ".join(checkpoints)
+        )
+        return ConversationHandler.END
 
-    return buffer
+    checkpoint = checkpoints[name]
+    if radius is None:
+        radius = checkpoint.get("radius", CHECKPOINT_RADIUS)
+    nearby = geofence.groups_within(radius, checkpoint["lat"], checkpoint["lng"])
+    await update.message.reply_text(
+        f"Within {radius:g}m of {name}:\n"
+        + "\n".join(f"@{username} {distance:.0f}m" for username, distance in nearby)
+        if nearby
+        else f"Nobody within {radius:g}m of {name}"
+    )
+    return ConversationHandler.END
 
 
 async def get_status(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
-    groups = firebase_util.get_all_group_status()
-
-    await update.message.reply_photo(
-        InputFile(create_table(list(map(get_progress_str_with_name, groups))))
+    groups = await firebase_util.get_all_group_status()
+    rows = list(
+        map(
+            get_progress_str_with_name,
+            sorted(groups, key=lambda group: group.get("name") or ""),
+        )
     )
+    digest = hashlib.sha256(json.dumps(rows).encode()).hexdigest()
+
+    file_id = status_cache["file_id"] if status_cache["digest"] == digest else None
+    if file_id:
+        try:
+            await update.message.reply_photo(file_id)
+            return ConversationHandler.END
+        except BadRequest:
+            logger.warning("Cached status image rejected, rendering again")
+
+    async with status_lock:
+        # Another /status may have uploaded this table while we waited
+        if status_cache["digest"] == digest and status_cache["file_id"] != file_id:
+            await update.message.reply_photo(status_cache["file_id"])
+            return ConversationHandler.END
+
+        msg = await update.message.reply_photo(InputFile(create_table(rows)))
+        status_cache.update({"digest": digest, "file_id": msg.photo[-1].file_id})
     return ConversationHandler.END
@@ -0,0 +1,167 @@
+import asyncio
+import logging
+from itertools import count
+from collections import deque
+from telegram import Bot
+from telegram.error import RetryAfter
+
+from ratelimit import TokenBucket
+from constants import (
+    SendPriority,
+    OUTBOUND_WORKERS,
+    TELEGRAM_MESSAGES_PER_SECOND,
+    TELEGRAM_CHAT_MESSAGES_PER_SECOND,
+    TELEGRAM_GROUP_MESSAGES_PER_MINUTE,
+    TELEGRAM_MAX_RETRIES,
+)
+
+logger = logging.getLogger("outbound")
+
+# chat id -> FIFO of pending sends, so each chat sees its messages in order
+chat_queues = {}
+# Chats with pending sends and nothing in flight, by priority of their oldest send
+ready = asyncio.PriorityQueue()
+busy = set()
+sequence = count()
+workers = []
+stats = {"sent": 0, "retries": 0, "failed": 0}
+
+global_bucket = TokenBucket(TELEGRAM_MESSAGES_PER_SECOND)
+chat_buckets = {}
+
+
+def chat_bucket(chat_id: int) -> TokenBucket:
+    if chat_id not in chat_buckets:
+        if chat_id < 0:
+            # Groups are limited per minute, so a burst may use the whole minute's
+            # allowance up front and RetryAfter covers anything Telegram still rejects
+            chat_buckets[chat_id] = TokenBucket(
+                TELEGRAM_GROUP_MESSAGES_PER_MINUTE / 60,
+                TELEGRAM_GROUP_MESSAGES_PER_MINUTE,
+            )
+        else:
+            chat_buckets[chat_id] = TokenBucket(TELEGRAM_CHAT_MESSAGES_PER_SECOND)
+    return chat_buckets[chat_id]
+
+
+def mark_ready(chat_id: int):
+    ready.put_nowait((chat_queues[chat_id][0]["priority"], next(sequence), chat_id))
+
+
+def enqueue(
+    priority: SendPriority, chat_id: int, send, *args, **kwargs
+) -> asyncio.Future:
+    future = asyncio.get_running_loop().create_future()
+    # Failures are logged by the worker, so fire-and-forget callers can ignore them
+    future.add_done_callback(lambda f: f.cancelled() or f.exception())
+    queue = chat_queues.setdefault(chat_id, deque())
+    queue.append(
+        {
+            "priority": priority,
+            "future": future,
+            "send": send,
+            "args": args,
+            "kwargs": kwargs,
+            "attempts": 0,
+        }
+    )
+    if len(queue) == 1 and chat_id not in busy:
+        mark_ready(chat_id)
+    return future
+
+
+def send_message(
+    priority: SendPriority, bot: Bot, chat_id: int, text: str, **kwargs
+) -> asyncio.Future:
+    return enqueue(priority, chat_id, bot.send_message, chat_id, text, **kwargs)
+
+
+def release(chat_id: int):
+    busy.discard(chat_id)
+    if chat_queues.get(chat_id):
+        mark_ready(chat_id)
+    else:
+        chat_queues.pop(chat_id, None)
+
+
+def resolve(future: asyncio.Future, result=None, exception: Exception = None):
+    # The caller may have cancelled while the send was in flight
+    if future.done():
+        return
+    if exception is not None:
+        future.set_exception(exception)
+    else:
+        future.set_result(result)
+
+
+async def process(chat_id: int):
+    item = chat_queues[chat_id][0]
+    if item["future"].done():
+        chat_queues[chat_id].popleft()
+        return
+
+    item["attempts"] += 1
+    try:
+        await chat_bucket(chat_id).acquire()
+        await global_bucket.acquire()
+        result = await item["send"](*item["args"], **item["kwargs"])
+    except RetryAfter as e:
+        if item["attempts"] <= TELEGRAM_MAX_RETRIES:
+            # Keep the chat busy until Telegram lets us send to it again
+            stats["retries"] += 1
+            logger.warning(f"Flood limited in {chat_id}, retrying in {e.retry_after}s")
+            asyncio.get_running_loop().call_later(e.retry_after, release, chat_id)
+            raise
+        stats["failed"] += 1
+        chat_queues[chat_id].popleft()
+        resolve(item["future"], exception=e)
+        logger.warning(f"Giving up on send to {chat_id}: {e}")
+        return
+    except Exception as e:
+        stats["failed"] += 1
+        chat_queues[chat_id].popleft()
+        resolve(item["future"], exception=e)
+        logger.warning(f"Send to {chat_id} failed: {e}")
+        return
+
+    stats["sent"] += 1
+    chat_queues[chat_id].popleft()
+    resolve(item["future"], result)
+
+
+async def worker():
+    while True:
+        _, _, chat_id = await ready.get()
+        busy.add(chat_id)
+        try:
+            await process(chat_id)
+        except RetryAfter:
+            # Released by the timer once the flood wait is over
+            continue
+        except Exception:
+            logger.exception(f"Outbound worker failed on {chat_id}")
+        release(chat_id)
+
+
+def start():
+    for _ in range(OUTBOUND_WORKERS):
+        workers.append(asyncio.create_task(worker()))
+
+
+async def stop(timeout: float = 10):
+    # Give queued sends a chance to go out before shutting down
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    while chat_queues and loop.time() < deadline:
+        await asyncio.sleep(0.1)
+    for task in workers:
+        task.cancel()
+    workers.clear()
+
+
+def get_stats() -> dict:
+    depth = {priority.name: 0 for priority in SendPriority}
+    for queue in chat_queues.values():
+        for item in queue:
+            depth[SendPriority(item["priority"]).name] += 1
+    return {**stats, "depth": depth, "chats": len(chat_queues), "busy": len(busy)}
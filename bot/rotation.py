@@ -0,0 +1,98 @@
+import asyncio
+import logging
+from itertools import count
+from telegram import Message
+from telegram.error import BadRequest
+from telegram.ext import ContextTypes
+
+import media_cache
+import outbound
+from ratelimit import TokenBucket
+from constants import (
+    SendPriority,
+    PHOTO_ROTATION_TIME,
+    ROTATION_TICK_INTERVAL,
+    ROTATION_EDITS_PER_SECOND,
+)
+
+logger = logging.getLogger("rotation")
+
+# Ticks per rotation, each rotation edits once every SLOTS ticks
+SLOTS = max(1, round(PHOTO_ROTATION_TIME / ROTATION_TICK_INTERVAL))
+
+# rotation id -> {"message", "frames", "idx", "caption", "due"}
+rotations = {}
+rotation_ids = count(1)
+tick_count = 0
+edit_bucket = TokenBucket(ROTATION_EDITS_PER_SECOND)
+
+
+def pick_due_tick() -> int:
+    # First edit lands 0.5-1.5 rotation periods out, in the least busy slot
+    load = [0] * SLOTS
+    for rotation in rotations.values():
+        load[rotation["due"] % SLOTS] += 1
+    start = tick_count + SLOTS // 2 + 1
+    return min(range(start, start + SLOTS), key=lambda tick: load[tick % SLOTS])
+
+
+def start_rotation(message: Message, frames: tuple[str], idx: int, caption: str) -> int:
+    rotation_id = next(rotation_ids)
+    rotations[rotation_id] = {
+        "message": message,
+        "frames": frames,
+        "idx": idx,
+        "caption": caption,
+        "due": pick_due_tick(),
+    }
+    return rotation_id
+
+
+def stop_rotation(rotation_id: int | None):
+    rotations.pop(rotation_id, None)
+
+
+def current_frame(rotation_id: int | None) -> str | None:
+    rotation = rotations.get(rotation_id)
+    return rotation["frames"][rotation["idx"]] if rotation else None
+
+
+def active_rotations() -> int:
+    return len(rotations)
+
+
+async def rotate(rotation_id: int, rotation: dict):
+    await edit_bucket.acquire()
+    if rotation_id not in rotations:
+        return
+    rotation["idx"] = (rotation["idx"] + 1) % len(rotation["frames"])
+    # Queued behind approvals and progress messages, so don't hold up the tick
+    outbound.enqueue(
+        SendPriority.Rotation,
+        rotation["message"].chat_id,
+        media_cache.edit_photo,
+        rotation["message"],
+        rotation["frames"][rotation["idx"]],
+        caption=rotation["caption"],
+    ).add_done_callback(lambda future: on_rotated(rotation_id, future))
+
+
+def on_rotated(rotation_id: int, future: asyncio.Future):
+    if future.cancelled():
+        return
+    if isinstance(future.exception(), BadRequest):
+        logger.warning(f"Stopping rotation {rotation_id}: {future.exception()}")
+        stop_rotation(rotation_id)
+
+
+async def tick(context: ContextTypes.DEFAULT_TYPE):
+    global tick_count
+    tick_count += 1
+    due = []
+    for rotation_id, rotation in list(rotations.items()):
+        # <= so rotations delayed by a slow tick still catch up
+        if rotation["due"] <= tick_count:
+            rotation["due"] += SLOTS
+            due.append(rotate(rotation_id, rotation))
+    if due:
+        await asyncio.gather(*due)
@@ -0,0 +1,50 @@
+import time
+import logging
+
+logger = logging.getLogger("startup")
+
+# Imported first by main.py, so this is as close to process start as we get
+started_at = time.perf_counter()
+last_mark = started_at
+phases = []
+first_update_seen = False
+
+
+def mark(name: str):
+    # Records the time since the previous mark as one sequential phase
+    global last_mark
+    now = time.perf_counter()
+    phases.append((name, last_mark - started_at, now - last_mark))
+    last_mark = now
+
+
+def timed(name: str, fn):
+    # Wraps fn so its runtime is recorded as a phase, e.g. for work run concurrently
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            phases.append((name, start - started_at, time.perf_counter() - start))
+
+    return wrapper
+
+
+def report():
+    for name, offset, duration in sorted(phases, key=lambda p: p[1]):
+        logger.info(
+            f"{name:<24} started +{offset * 1000:7.1f}ms took {duration * 1000:7.1f}ms"
+        )
+    logger.info(
+        f"Ready to serve after {(time.perf_counter() - started_at) * 1000:.1f}ms"
+    )
+
+
+def first_update():
+    global first_update_seen
+    if first_update_seen:
+        return
+    first_update_seen = True
+    logger.info(
+        f"First update received {(time.perf_counter() - started_at) * 1000:.1f}ms after start"
+    )
@@ -0,0 +1,73 @@
+from io import BytesIO
+from functools import lru_cache
+from PIL import Image, ImageDraw, ImageFont
+
+FONT_SIZE = 28
+CELL_PADDING = 16  # px
+BORDER_COLOR = (0, 0, 0)
+TEXT_COLOR = (0, 0, 0)
+BACKGROUND_COLOR = (255, 255, 255)
+
+
+@lru_cache
+def get_font(bold: bool) -> tuple[ImageFont.FreeTypeFont, int]:
+    # Returns the font and the stroke width needed to fake bold without a bold face
+    try:
+        return (
+            ImageFont.truetype(
+                "DejaVuSans-Bold.ttf" if bold else "DejaVuSans.ttf", FONT_SIZE
+            ),
+            0,
+        )
+    except OSError:
+        return ImageFont.load_default(FONT_SIZE), 1 if bold else 0
+
+
+def text_width(text: str, bold: bool) -> int:
+    font, stroke = get_font(bold)
+    return int(font.getlength(text)) + 2 * stroke
+
+
+def render_table(header: list[str], rows: list[list[str]]) -> BytesIO:
+    header_font, header_stroke = get_font(True)
+    body_font, _ = get_font(False)
+    ascent, descent = header_font.getmetrics()
+    row_height = ascent + descent + 2 * CELL_PADDING
+
+    col_widths = [
+        max(
+            [text_width(str(title), True)]
+            + [text_width(str(row[col]), False) for row in rows]
+        )
+        + 2 * CELL_PADDING
+        for col, title in enumerate(header)
+    ]
+    width = sum(col_widths) + 1
+    height = row_height * (len(rows) + 1) + 1
+
+    image = Image.new("RGB", (width, height), BACKGROUND_COLOR)
+    draw = ImageDraw.Draw(image)
+
+    for row_idx, row in enumerate([header] + rows):
+        top = row_idx * row_height
+        left = 0
+        for col, text in enumerate(row):
+            draw.rectangle(
+                (left, top, left + col_widths[col], top + row_height),
+                outline=BORDER_COLOR,
+            )
+            draw.text(
+                (left + col_widths[col] / 2, top + row_height / 2),
+                str(text),
+                fill=TEXT_COLOR,
+                font=header_font if row_idx == 0 else body_font,
+                anchor="mm",
+                stroke_width=header_stroke if row_idx == 0 else 0,
+                stroke_fill=TEXT_COLOR,
+            )
+            left += col_widths[col]
+
+    buffer = BytesIO()
+    image.save(buffer, format="PNG", compress_level=1)
+    buffer.seek(0)
+    return buffer
@@ -0,0 +1,101 @@
+import os
+import json
+import time
+import logging
+import functools
+import threading
+import contextvars
+from collections import Counter
+
+from constants import TRACE_ROUND_TRIP_BUDGET
+
+logger = logging.getLogger("tracing")
+
+# Update the current task or executor thread is working on
+current_update = contextvars.ContextVar("current_update", default=None)
+
+# Firestore RPCs land on executor threads, so traces are updated under a lock
+lock = threading.Lock()
+# update id -> trace, only while the update is being handled
+traces = {}
+
+
+def record_call(function: str):
+    trace = traces.get(current_update.get())
+    if trace:
+        with lock:
+            trace["calls"][function] += 1
+
+
+def record_rpc(function: str, kind: str):
+    trace = traces.get(current_update.get())
+    if trace:
+        with lock:
+            trace[kind] += 1
+            trace["rpcs"][function] += 1
+
+
+def summarize(trace: dict) -> dict:
+    return {
+        "update_id": trace["update_id"],
+        "handler": trace["handler"],
+        "state": trace["state"],
+        "reads": trace["read"],
+        "writes": trace["write"],
+        "transactions": trace["transaction"],
+        "round_trips": trace["read"] + trace["write"] + trace["transaction"],
+        "seconds": round(time.perf_counter() - trace["started"], 4),
+        "calls": dict(trace["calls"]),
+        "rpcs": dict(trace["rpcs"]),
+    }
+
+
+def finish(trace: dict):
+    with lock:
+        summary = summarize(trace)
+    message = (
+        f"Update {summary['update_id']} ({summary['handler']}): "
+        f"{summary['reads']} reads, {summary['writes']} writes, "
+        f"{summary['transactions']} transactions in {summary['seconds']}s"
+    )
+    if summary["round_trips"] > TRACE_ROUND_TRIP_BUDGET:
+        logger.warning(f"{message}, over budget: {summary['rpcs']}")
+    elif os.environ.get("TRACE_UPDATES"):
+        logger.info(message)
+
+    # Read per update since .env is only loaded after the imports in main
+    trace_file = os.environ.get("TRACE_FILE")
+    if trace_file:
+        with open(trace_file, "a") as f:
+            f.write(json.dumps(summary) + "\n")
+
+
+def traced(callback, state: str):
+    @functools.wraps(callback)
+    async def fn(update, context, *args, **kwargs):
+        update_id = getattr(update, "update_id", None)
+        # Only the outermost handler for an update owns its trace
+        if update_id is None or current_update.get() is not None:
+            return await callback(update, context, *args, **kwargs)
+
+        trace = {
+            "update_id": update_id,
+            "handler": callback.__name__,
+            "state": state,
+            "started": time.perf_counter(),
+            "read": 0,
+            "write": 0,
+            "transaction": 0,
+            "calls": Counter(),
+            "rpcs": Counter(),
+        }
+        traces[update_id] = trace
+        token = current_update.set(update_id)
+        try:
+            return await callback(update, context, *args, **kwargs)
+        finally:
+            current_update.reset(token)
+            traces.pop(update_id, None)
+            finish(trace)
+
+    return fn
@@ -6,15 +6,17 @@ from telegram.ext import (
 )
 
 import firebase_util
+import media_cache
+import outbound
 from utils import send_challenges
-from constants import Role, ConvState, Direction
+from constants import Role, ConvState, Direction, SendPriority
 
 logger = logging.getLogger("user_setup")
 
 
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     if context.user_data.get("role") == Role.Admin:
-        firebase_util.register_admin(update.message.from_user.username)
+        await firebase_util.register_admin(update.message.from_user.username)
         logger.info(f"Admin @{update.message.from_user.username} registered")
         await update.message.reply_text("Welcome back admin!")
         return ConversationHandler.END
@@ -24,7 +26,7 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
         await update.message.reply_text("You've already registered!")
         return ConversationHandler.END
 
-    success = firebase_util.register_user(
+    success = await firebase_util.register_user(
         update.message.from_user.username, update.message.from_user.id
     )
     if not success:
@@ -43,7 +45,7 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
 
 async def config_group(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     message = update.message
-    firebase_util.set_broadcast_group(message.from_user.username, message.chat_id)
+    await firebase_util.set_broadcast_group(message.from_user.username, message.chat_id)
     await update.message.reply_text("I'll send updates to this group from now on!")
     return ConversationHandler.END
 
@@ -75,14 +77,16 @@ START_RACE_MARKUP = InlineKeyboardMarkup(
 
 
 async def start_race(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
-    if firebase_util.has_race_started(update.message.from_user.username):
+    if await firebase_util.has_race_started(update.message.from_user.username):
         await update.message.reply_text(
             "Your race has already started! Stop wasting time!"
         )
         return ConversationHandler.END
-    await update.message.reply_photo(
-        open("images/route.png", "rb"),
-        "Choose your direction for challenges\n\n/cancel if you have not been authorized to start",
+    await media_cache.send_photo(
+        context.bot,
+        update.message.chat_id,
+        "images/route.png",
+        caption="Choose your direction for challenges\n\n/cancel if you have not been authorized to start",
         reply_markup=START_RACE_MARKUP,
     )
     return ConvState.ChooseDirection
@@ -115,25 +119,29 @@ async def confirm_direction(update: Update, context: ContextTypes.DEFAULT_TYPE)
         reply_markup=None,
     )
 
-    firebase_util.start_race(query.from_user.username, query.data)
-    group_info, loc, challenge = firebase_util.get_current_challenge(
+    await firebase_util.start_race(query.from_user.username, query.data)
+    group_info, loc, challenge = await firebase_util.get_current_challenge(
         query.from_user.username
     )
 
-    await context.bot.send_message(
+    outbound.send_message(
+        SendPriority.Progress,
+        context.bot,
         group_info.get("broadcast_channel"),
         f"Ahoy! The treasure hunt begins!\n\nRoute Chosen: Direction {query.data[0]}, Toa Payoh {'First' if query.data[1] == '1' else 'Last'}",
     )
 
-    await send_challenges(
+    send_challenges(
         context.bot,
         group_info.get("broadcast_channel"),
         loc,
         challenge,
     )
 
-    admin_broadcast, admin_broadcast_thread = firebase_util.get_admin_broadcast()
-    await context.bot.send_message(
+    admin_broadcast, admin_broadcast_thread = await firebase_util.get_admin_broadcast()
+    outbound.send_message(
+        SendPriority.Progress,
+        context.bot,
         admin_broadcast,
         f"{group_info.get('name')} has started the race",
         message_thread_id=admin_broadcast_thread,
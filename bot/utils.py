@@ -1,21 +1,23 @@
-import os
 import random
-import subprocess
-import platform
 from functools import reduce
-from telegram import Bot, InputMediaPhoto
+from telegram import Bot
 from telegram.ext import ContextTypes
+import media_cache
+import outbound
+import rotation
 from constants import (
+    SendPriority,
     ConvState,
     ChallengeType,
     Direction,
-    PHOTO_ROTATION_TIME,
     NUMBER_LOCATIONS,
 )
 
 
-async def send_challenges(bot: Bot, chat_id: int, loc: str, challenges):
-    await bot.send_message(
+def send_challenges(bot: Bot, chat_id: int, loc: str, challenges):
+    return outbound.send_message(
+        SendPriority.Progress,
+        bot,
         chat_id,
         reduce(
             lambda acc, iv: acc
@@ -28,38 +30,26 @@ async def send_challenges(bot: Bot, chat_id: int, loc: str, challenges):
 
 async def send_step(chat_id: id, context: ContextTypes.DEFAULT_TYPE, step):
     if "rotating_media" in step:
-        dir = "images/" + step["rotating_media"] + "/"
-        filenames = list(map(lambda x: dir + x, os.listdir(dir)))
-        files = list(
-            map(
-                lambda x: InputMediaPhoto(open(x, "rb"), caption=step["description"]),
-                filenames,
-            )
-        )
-        start_idx = random.randint(0, len(filenames) - 1)
+        frames = media_cache.get_rotation_set("images/" + step["rotating_media"])
+        start_idx = random.randint(0, len(frames) - 1)
 
-        msg = await context.bot.send_photo(
-            chat_id, open(filenames[start_idx], "rb"), caption=step["description"]
+        msg = await media_cache.send_photo(
+            context.bot, chat_id, frames[start_idx], caption=step["description"]
         )
-        job = None
-
-        async def rotate_photo(ctx: ContextTypes.DEFAULT_TYPE):
-            ctx.job.data["idx"] += 1
-            if ctx.job.data["idx"] >= len(files):
-                ctx.job.data["idx"] = 0
-            await msg.edit_media(files[ctx.job.data["idx"]])
 
-        job = context.job_queue.run_repeating(
-            rotate_photo,
-            PHOTO_ROTATION_TIME,
-            data={"idx": start_idx, "filenames": filenames},
+        context.user_data.update(
+            {
+                "rotation": rotation.start_rotation(
+                    msg, frames, start_idx, step["description"]
+                )
+            }
         )
-        context.user_data.update({"job": job})
 
     elif "media" in step:
-        await context.bot.send_photo(
+        await media_cache.send_photo(
+            context.bot,
             chat_id,
-            open("images/" + step["media"], "rb"),
+            "images/" + step["media"],
             caption=step["description"],
         )
     else:
@@ -75,35 +65,6 @@ def challenge_type_to_conv_state(chall_type: ChallengeType):
         return ConvState.SubmitPhoto
 
 
-def get_logs(err: bool):
-    try:
-        result = subprocess.run(
-            [
-                "pm2",
-                "logs",
-                "bot",
-                ("--err" if err else "--out"),
-                "--nostream",
-                "--raw",
-                "--lines",
-                "100",
-            ],
-            capture_output=True,
-            text=True,
-            shell=platform.system() != "Linux",
-        )
-
-        if result.returncode == 0:
-            return result.stdout + result.stderr
-        else:
-            return f"Error reading logs: {result.stderr}"
-
-    except Exception as e:
-        print(f"An error occurred: {e}")
-
-    return "Error"
-
-
 def get_start_chall_index(direction: Direction) -> int:
     if direction == Direction.A0:
         return 1
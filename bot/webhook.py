@@ -0,0 +1,191 @@
+import hmac
+import asyncio
+import logging
+from collections import OrderedDict
+from http import HTTPStatus
+from urllib.parse import parse_qs
+
+try:
+    from orjson import loads
+except ImportError:
+    from json import loads
+
+from constants import WEBHOOK_DEDUP_SIZE
+
+logger = logging.getLogger("webhook")
+
+# Recently received update ids, oldest first, to drop Telegram's redeliveries
+seen_updates = OrderedDict()
+
+CORS_HEADERS = [
+    (b"access-control-allow-origin", b"*"),
+    (b"access-control-allow-methods", b"GET, POST, OPTIONS"),
+    (b"access-control-allow-headers", b"*"),
+]
+
+
+class Request:
+    def __init__(self, scope: dict, body: bytes):
+        self.method = scope["method"]
+        self.path = scope["path"]
+        self.headers = {
+            name.decode("latin-1"): value.decode("latin-1")
+            for name, value in scope["headers"]
+        }
+        self.query = {
+            key: values[-1]
+            for key, values in parse_qs(scope["query_string"].decode()).items()
+        }
+        self.body = body
+
+    def json(self):
+        return loads(self.body)
+
+
+class Response:
+    def __init__(
+        self,
+        body: bytes | str = b"",
+        status: int = HTTPStatus.OK,
+        content_type: str = "text/plain",
+    ):
+        self.body = body.encode() if isinstance(body, str) else body
+        self.status = status
+        self.content_type = content_type
+
+    async def send(self, send, headers: list, receive):
+        await send(
+            {
+                "type": "http.response.start",
+                "status": self.status,
+                "headers": headers
+                + [
+                    (b"content-type", self.content_type.encode()),
+                    (b"content-length", str(len(self.body)).encode()),
+                ],
+            }
+        )
+        await send({"type": "http.response.body", "body": self.body})
+
+
+class StreamingResponse:
+    def __init__(
+        self,
+        chunks,
+        status: int = HTTPStatus.OK,
+        content_type: str = "text/plain",
+    ):
+        self.chunks = chunks
+        self.status = status
+        self.content_type = content_type
+
+    async def send(self, send, headers: list, receive):
+        await send(
+            {
+                "type": "http.response.start",
+                "status": self.status,
+                "headers": headers
+                + [
+                    (b"content-type", self.content_type.encode()),
+                    (b"cache-control", b"no-cache"),
+                ],
+            }
+        )
+
+        async def pump():
+            async for chunk in self.chunks:
+                await send(
+                    {
+                        "type": "http.response.body",
+                        "body": chunk.encode() if isinstance(chunk, str) else chunk,
+                        "more_body": True,
+                    }
+                )
+
+        async def disconnected():
+            while (await receive())["type"] != "http.disconnect":
+                pass
+
+        # Stop streaming as soon as the client goes away
+        pumping = asyncio.create_task(pump())
+        waiting = asyncio.create_task(disconnected())
+        await asyncio.wait({pumping, waiting}, return_when=asyncio.FIRST_COMPLETED)
+        waiting.cancel()
+        if not pumping.done():
+            pumping.cancel()
+            return
+        await send({"type": "http.response.body", "body": b""})
+
+
+async def server_sent_events(texts):
+    async for text in texts:
+        yield "".join(f"data: {line}\n" for line in text.split("\n")) + "\n"
+
+
+def valid_secret(request: Request, secret: str) -> bool:
+    token = request.headers.get("x-telegram-bot-api-secret-token", "")
+    return hmac.compare_digest(token.encode("latin-1"), secret.encode())
+
+
+def first_delivery(update_id: int) -> bool:
+    if update_id in seen_updates:
+        return False
+    seen_updates[update_id] = None
+    if len(seen_updates) > WEBHOOK_DEDUP_SIZE:
+        seen_updates.popitem(last=False)
+    return True
+
+
+def forget(update_id: int):
+    # Lets Telegram's redelivery through when the first attempt was not queued
+    seen_updates.pop(update_id, None)
+
+
+class App:
+    """Bare ASGI app, just enough routing for the webhook and monitoring"""
+
+    def __init__(self, cors: bool = False):
+        self.routes = {}
+        self.headers = CORS_HEADERS if cors else []
+
+    def route(self, method: str, path: str):
+        def decorator(handler):
+            self.routes[(method, path)] = handler
+            return handler
+
+        return decorator
+
+    def get(self, path: str):
+        return self.route("GET", path)
+
+    def post(self, path: str):
+        return self.route("POST", path)
+
+    async def __call__(self, scope: dict, receive, send):
+        if scope["type"] != "http":
+            return
+
+        handler = self.routes.get((scope["method"], scope["path"]))
+        if handler is None:
+            if scope["method"] == "OPTIONS" and self.headers:
+                response = Response(status=HTTPStatus.NO_CONTENT)
+            elif any(path == scope["path"] for _, path in self.routes):
+                response = Response(status=HTTPStatus.METHOD_NOT_ALLOWED)
+            else:
+                response = Response(status=HTTPStatus.NOT_FOUND)
+            await response.send(send, self.headers, receive)
+            return
+
+        body = b""
+        more_body = scope["method"] == "POST"
+        while more_body:
+            message = await receive()
+            body += message.get("body", b"")
+            more_body = message.get("more_body", False)
+
+        try:
+            response = await handler(Request(scope, body))
+        except Exception:
+            logger.exception(f"{scope['method']} {scope['path']} failed")
+            response = Response(status=HTTPStatus.INTERNAL_SERVER_ERROR)
+        await response.send(send, self.headers, receive)